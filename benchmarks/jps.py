@@ -0,0 +1,60 @@
+'''
+Compares jump point search against plain A* on generated dungeons.
+
+Run from the repository root with: python -m benchmarks.jps
+'''
+import argparse
+import random
+import time
+
+from src import tiles
+from src import util
+from src import player
+from src import levelgen
+
+GENERATOR_PARAMS = dict(iters=2000, max_room_size=7)
+
+def generate(dims, seed):
+    tilemap = tiles.Tilemap(dims)
+    levelgen.generate_level(dims, GENERATOR_PARAMS, seed).apply(tilemap)
+    return tilemap
+
+def time_search(graph, search, queries):
+    expansions = 0
+    start = time.perf_counter()
+
+    for origin, dest in queries:
+        search(origin, dest, heuristic=util.chebyshev_distance)
+        expansions += graph.last_expansions
+
+    return time.perf_counter() - start, expansions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[32, 64, 128])
+    parser.add_argument("--seeds", type=int, default=5)
+    parser.add_argument("--queries", type=int, default=50)
+    args = parser.parse_args()
+
+    print(f"{'size':>6} {'astar ms':>10} {'jps ms':>10} {'astar nodes':>12} {'jps nodes':>10}")
+
+    for size in args.sizes:
+        astar_time = jps_time = astar_nodes = jps_nodes = 0
+
+        for seed in range(args.seeds):
+            tilemap = generate((size, size), seed)
+            graph = tilemap.get_grid_graph(tiles.DEFAULT_TILE_WEIGHTS, player.PlayerSystem.PLAYER_DELTAS_COST)
+            rng = random.Random(seed)
+            empty = list(tilemap.iterate_with_tile(tiles.Tile.EMPTY))
+            queries = [(rng.choice(empty), rng.choice(empty)) for _ in range(args.queries)]
+
+            elapsed, nodes = time_search(graph, graph.pathfind, queries)
+            astar_time, astar_nodes = astar_time + elapsed, astar_nodes + nodes
+            elapsed, nodes = time_search(graph, graph.pathfind_jps, queries)
+            jps_time, jps_nodes = jps_time + elapsed, jps_nodes + nodes
+
+        count = args.seeds * args.queries
+        print(f"{size:>6} {astar_time / count * 1000:>10.3f} {jps_time / count * 1000:>10.3f} {astar_nodes / count:>12.1f} {jps_nodes / count:>10.1f}")
+
+if __name__ == "__main__":
+    main()
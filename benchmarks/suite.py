@@ -0,0 +1,241 @@
+'''
+Benchmarks the engine's hot paths at several map sizes and entity counts with fixed seeds, and reports them as JSON
+so runs can be compared over time.
+
+Run from the repository root with: python -m benchmarks.suite -o results.json
+Use --only to pick benchmarks by name, e.g. --only los visibility.
+'''
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+
+import numpy as np
+
+from src import ecs
+from src import components
+from src import tiles
+from src import events
+from src import util
+from src import levelgen
+from src import entity_definitions
+from src import player
+from src import nextdungeon
+from src import headless
+from src import behaviour
+
+# the game's default sequential corridors take minutes on the large maps
+GENERATOR_PARAMS = dict(nextdungeon.NextDungeonSystem.GENERATOR_PARAMS, connection_strategy=tiles.CORRIDORS_SPANNING_TREE, extra_loops=4)
+
+def measure(function, min_time=0.2, max_repeats=1000, before=None):
+    '''
+    Call function until min_time has passed (at least once) and return the per call times in seconds.
+    before is called ahead of every call without being timed.
+    '''
+    times = []
+    total = 0
+
+    while not times or (total < min_time and len(times) < max_repeats):
+        if before is not None:
+            before()
+
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        times.append(elapsed)
+        total += elapsed
+
+    return times
+
+def make_tilemap(size, seed):
+    tilemap = tiles.Tilemap((size, size))
+    levelgen.generate_level((size, size), GENERATOR_PARAMS, seed).apply(tilemap)
+    return tilemap
+
+def make_world(size, entities, seed):
+    '''
+    A generated level with the player and the given number of monsters, and every gameplay system registered.
+    '''
+    clock = headless.SimulatedClock()
+    em = ecs.TilemapEcs(make_tilemap(size, seed), clock)
+    components.enable_columnar_storage(em)
+    headless.register_gameplay_systems(em)
+    rng = random.Random(seed)
+    spawners = (entity_definitions.goblin, entity_definitions.rat, entity_definitions.water)
+
+    em.create_entity(em.tilemap.get_random_empty_tile(rng), *entity_definitions.player())
+
+    for i in range(entities):
+        em.create_entity(em.tilemap.get_random_empty_tile(rng), *spawners[i % len(spawners)]())
+
+    return em, clock
+
+def random_floor(tilemap, rng, count):
+    floor = list(tilemap.iterate_with_tile(tiles.Tile.EMPTY))
+    return [rng.choice(floor) for _ in range(count)]
+
+def bench_query(size, entities, seed):
+    em, _ = make_world(size, entities, seed)
+    return lambda: list(em.query_all_with_components(components.HealthComponent, components.CollisionComponent))
+
+def bench_graph_pathfind(size, entities, seed):
+    tilemap = make_tilemap(size, seed)
+    origin, dest = random_floor(tilemap, random.Random(seed), 2)
+
+    def run():
+        graph = tilemap.get_graph(tiles.DEFAULT_TILE_WEIGHTS, util.CARDINAL_DELTAS_COST)
+        graph.pathfind(origin, dest, heuristic=util.manhatten_distance)
+
+    return run
+
+def bench_los(size, entities, seed):
+    tilemap = make_tilemap(size, seed)
+    rng = random.Random(seed)
+    origins = random_floor(tilemap, rng, 100)
+    pairs = [(origin, (origin[0] + rng.randint(-8, 8), origin[1] + rng.randint(-8, 8))) for origin in origins]
+    pairs = [(origin, target) for origin, target in pairs if tilemap.pos_is_in_bounds(target)]
+
+    def run():
+        # writing a tile bumps the version, even an unchanged one, so every run measures uncached lookups
+        tilemap[0, 0] = tilemap[0, 0]
+
+        for origin, target in pairs:
+            tilemap.in_los(origin, target)
+
+    return run
+
+def bench_radius(size, entities, seed):
+    tilemap = make_tilemap(size, seed)
+    origins = random_floor(tilemap, random.Random(seed), 100)
+
+    def run():
+        for origin in origins:
+            list(tilemap.iterate_radius(origin, 8))
+
+    return run
+
+def bench_visibility(size, entities, seed):
+    em, _ = make_world(size, entities, seed)
+    player_system = player.PlayerSystem()
+    player_entity = em.view(components.PlayerControlComponent).single()
+    return lambda: player_system.update_visibility(em, player_entity)
+
+def bench_generate(size, entities, seed):
+    def run():
+        tilemap = tiles.Tilemap((size, size))
+        tilemap.generate_random_connected_rooms(verbose=False, rng=random.Random(seed), **GENERATOR_PARAMS)
+
+    return run
+
+def bench_gamestep(size, entities, seed):
+    em, clock = make_world(size, entities, seed)
+    random.seed(seed)
+    player_entity = em.view(components.PlayerControlComponent).single()
+
+    def run():
+        if player_entity in em.view(components.PlayerControlComponent):
+            em.add_components(player_entity, player.PlayerSystem.IDLE_ACTION)
+
+        em.emit_event(events.GamestepEvent())
+        clock.advance(headless.HeadlessGame.TURN_MS)
+
+    return run
+
+def bench_render(size, entities, seed):
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    import pygame
+    from src import graphics
+    from src import resources
+
+    pygame.init()
+    # keep the offscreen window at a sane size for the large maps
+    tile_scale = max(4, min(32, 2048 // size))
+    em, clock = make_world(size, entities, seed)
+    player_entity = em.view(components.PlayerControlComponent).single()
+    player.PlayerSystem().update_visibility(em, player_entity)
+    res = resources.load_res("res", tile_scale=tile_scale)
+    graphics_system = graphics.GraphicsSystem(res, tile_scale=tile_scale, window_dimensions=(size * tile_scale, size * tile_scale + 40))
+    em.register_system(graphics_system, events.RenderTickEvent)
+    event = events.RenderTickEvent(16, (0, 0), False)
+    # the first frame builds the cached tile layer, measure the frames after it
+    graphics_system.process(em, event)
+    rng = random.Random(seed)
+
+    def play_turn():
+        # the player wanders around, so every frame redraws the cells whose visibility changed and the moved sprites
+        if player_entity in em.view(components.PlayerControlComponent):
+            em.add_components(player_entity, rng.choice(behaviour.BehaviourSystem.MOVES[:4]))
+
+        em.emit_event(events.GamestepEvent())
+        clock.advance(headless.HeadlessGame.TURN_MS)
+
+    return play_turn, lambda: graphics_system.process(em, event)
+
+# name: (setup, uses the entity count)
+BENCHMARKS = {
+    "query": (bench_query, True),
+    "graph_pathfind": (bench_graph_pathfind, False),
+    "los": (bench_los, False),
+    "radius": (bench_radius, False),
+    "visibility": (bench_visibility, False),
+    "generate": (bench_generate, False),
+    "gamestep": (bench_gamestep, True),
+    "render": (bench_render, True),
+}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[32, 128, 512])
+    parser.add_argument("--entities", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--min-time", type=float, default=0.2, help="minimum seconds spent per measurement")
+    parser.add_argument("--only", nargs="+", choices=list(BENCHMARKS), default=list(BENCHMARKS))
+    parser.add_argument("-o", "--output", default=None, help="JSON file to write, defaults to stdout")
+    args = parser.parse_args()
+
+    results = []
+
+    for name in args.only:
+        setup, uses_entities = BENCHMARKS[name]
+
+        for size in args.sizes:
+            for entities in (args.entities if uses_entities else [0]):
+                benchmark = setup(size, entities, args.seed)
+                # a setup returns the function to time, or (untimed preparation, function to time)
+                before, function = benchmark if isinstance(benchmark, tuple) else (None, benchmark)
+                times = measure(function, args.min_time, before=before)
+                results.append({
+                    "name": name,
+                    "size": size,
+                    "entities": entities,
+                    "repeats": len(times),
+                    "min_ms": min(times) * 1000,
+                    "median_ms": statistics.median(times) * 1000,
+                    "mean_ms": statistics.fmean(times) * 1000,
+                })
+                print(f"{name:>16} {size:>5} {entities:>6} {statistics.median(times) * 1000:>12.3f} ms", file=sys.stderr)
+
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "seed": args.seed,
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": results,
+    }
+
+    if args.output is None:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    else:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+
+if __name__ == "__main__":
+    main()
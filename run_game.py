@@ -3,7 +3,10 @@ import sys
 
 MIN_VER = (3, 13)
 
-if sys.version_info[:2] < MIN_VER:
-    print("This game might or might not work with your version of Python. It was created with 3.13.")
+# the next level is generated in a spawned worker process, which imports this module again as __mp_main__
+if __name__ == "__main__":
+    if sys.version_info[:2] < MIN_VER:
+        print("This game might or might not work with your version of Python. It was created with 3.13.")
 
-import src.main
\ No newline at end of file
+    import src.main
+    src.main.main()
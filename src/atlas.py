@@ -0,0 +1,96 @@
+'''
+All images of the game packed into one surface in the display's pixel format, together with variants of them
+(fog of war, damage flash, highlight) that are made once when the atlas is built. Drawing then only ever blits
+parts of this one surface, nothing gets converted or allocated while a frame is drawn.
+
+The atlas needs a display mode, so build it after pygame.display.set_mode.
+'''
+from typing import *
+import math
+
+import pygame
+
+NORMAL = "normal"
+FOG = "fog"
+DAMAGE = "damage"
+HIGHLIGHT = "highlight"
+
+def _fog(img: pygame.Surface) -> pygame.Surface:
+    return pygame.transform.grayscale(img)
+
+def _damage(img: pygame.Surface) -> pygame.Surface:
+    img = img.copy()
+    img.fill((255, 80, 80), special_flags=pygame.BLEND_RGB_MULT)
+    return img
+
+def _highlight(img: pygame.Surface) -> pygame.Surface:
+    img = img.copy()
+    img.fill((70, 70, 70), special_flags=pygame.BLEND_RGB_ADD)
+    return img
+
+# variant name: function making it from the original image
+VARIANTS: Dict[str, Callable[[pygame.Surface], pygame.Surface]] = {
+    FOG: _fog,
+    DAMAGE: _damage,
+    HIGHLIGHT: _highlight,
+}
+
+class SpriteAtlas:
+    def __init__(self, images: Dict[str, pygame.Surface], variants: Iterable[str] = tuple(VARIANTS)):
+        '''
+        Pack images and the given variants of each of them into one surface. Images are keyed like in
+        resources.load_res, non surface values (fonts) are skipped so its result can be passed in directly.
+        '''
+        variants = [NORMAL, *variants]
+        entries = []
+
+        for key, img in images.items():
+            if not isinstance(img, pygame.Surface):
+                continue
+
+            img = img.convert_alpha()
+
+            for variant in variants:
+                entries.append(((key, variant), img if variant == NORMAL else VARIANTS[variant](img)))
+
+        self.surface, rects = SpriteAtlas._pack(entries)
+        # subsurfaces share the atlas' pixels, so handing them out costs nothing
+        self._sprites: Dict[Tuple[str, str], pygame.Surface] = {key: self.surface.subsurface(rect) for key, rect in rects.items()}
+
+    @staticmethod
+    def _pack(entries: List[Tuple[Tuple[str, str], pygame.Surface]]) -> Tuple[pygame.Surface, Dict[Tuple[str, str], pygame.Rect]]:
+        '''
+        Shelf packing: images sorted by height are put left to right into rows about as wide as the atlas is high.
+        '''
+        entries = sorted(entries, key=lambda entry: -entry[1].get_height())
+        area = sum(img.get_width() * img.get_height() for _, img in entries)
+        row_width = max([math.ceil(math.sqrt(area))] + [img.get_width() for _, img in entries])
+        rects = {}
+        x = y = row_height = width = 0
+
+        for key, img in entries:
+            if x + img.get_width() > row_width:
+                x, y, row_height = 0, y + row_height, 0
+
+            rects[key] = pygame.Rect((x, y), img.get_size())
+            x += img.get_width()
+            width = max(width, x)
+            row_height = max(row_height, img.get_height())
+
+        surface = pygame.Surface((max(width, 1), max(y + row_height, 1)), pygame.SRCALPHA).convert_alpha()
+        surface.fill((0, 0, 0, 0))
+
+        for key, img in entries:
+            # the atlas is fully transparent, taking the maximum copies the pixels exactly including their alpha
+            surface.blit(img, rects[key], special_flags=pygame.BLEND_RGBA_MAX)
+
+        return surface, rects
+
+    def __contains__(self, key: str) -> bool:
+        return (key, NORMAL) in self._sprites
+
+    def get(self, key: str, variant: str = NORMAL) -> pygame.Surface:
+        return self._sprites[key, variant]
+
+    def blit(self, target: pygame.Surface, key: str, pos: Tuple[int, int], variant: str = NORMAL) -> pygame.Rect:
+        return target.blit(self._sprites[key, variant], pos)
@@ -8,6 +8,7 @@ from . import components
 from . import tiles
 from . import events
 from . import util
+from . import pathfinding
 
 class BehaviourSystem(ecs.System):
     MOVES = (components.MovementActionComponent(1, 0), 
@@ -17,13 +18,29 @@ class BehaviourSystem(ecs.System):
              components.MovementActionComponent(0, 0))
     
     DELTAS_COST = util.CARDINAL_DELTAS_COST | util.DIAGONAL_DELTAS_COST
+    CHASE_MAP_RADIUS = 24 # hostiles further away from the player than this plan across the rooms instead
 
     def __init__(self):
-        pass
+        # one Dijkstra map per max distance
+        self._goal_maps: Dict[float, pathfinding.DijkstraMap] = {}
+
+    def get_goal_map(self, em: ecs.TilemapEcs, goals: Iterable[Tuple[int, int]], max_distance: float = float("inf")) -> pathfinding.DijkstraMap:
+        '''
+        Dijkstra map toward the given goals, shared by every NPC this turn. It is only recomputed when the goals or the map change.
+        '''
+        graph = em.tilemap.get_grid_graph(tiles.DEFAULT_TILE_WEIGHTS, BehaviourSystem.DELTAS_COST)
+        goal_map = self._goal_maps.get(max_distance)
+
+        if goal_map is None or goal_map.graph is not graph:
+            goal_map = self._goal_maps[max_distance] = pathfinding.DijkstraMap(graph, max_distance)
+
+        goal_map.update(goals)
+        return goal_map
 
     def find_best_flee_move(self, em: ecs.TilemapEcs, fleer: ecs.Entity, threat: ecs.Entity):
         y, x = em.get_pos(fleer)
         threat_pos = em.get_pos(threat)
+        flee_map = self.get_goal_map(em, [threat_pos]).get_flee_map()
         
         valid_moves = []
 
@@ -31,31 +48,36 @@ class BehaviourSystem(ecs.System):
             dy, dx = move
             new_y, new_x = y + dy, x + dx
 
-            if em.tilemap.pos_is_in_bounds((new_y, new_x)) and not em.tilemap[new_y, new_x].is_collider():
+            if em.tilemap.pos_is_in_bounds((new_y, new_x)) and not em.tilemap.is_collider((new_y, new_x)):
                 valid_moves.append(move)
 
-        def distance_to_threat(move: components.MovementActionComponent) -> float:
+        def flee_preference(move: components.MovementActionComponent) -> Tuple[float, float]:
             dy, dx = move
             new_pos = y + dy, x + dx
-            return util.distance(new_pos, threat_pos)
+            # lower flee map values lead away from the threat, the straight line distance breaks ties
+            # and takes over when the fleer can not reach the threat at all
+            return -flee_map.get(new_pos), util.distance(new_pos, threat_pos)
         
-        valid_moves.sort(key=distance_to_threat)
+        valid_moves.sort(key=flee_preference)
         return valid_moves[-1]
     
     
     
     def go_toward(self, em: ecs.TilemapEcs, entity: ecs.Entity, pos: Tuple[int, int]):
+        '''
+        Plan a path to pos across the rooms and take its first step. The search only refines the rooms and corridors
+        on the way, so it costs about as much as the number of rooms crossed, however far away pos is.
+        '''
         pathfind_data: components.PathfindTargetComponent = entity.get_component(em, components.PathfindTargetComponent)
         entity_pos = em.get_pos(entity)
 
         if entity_pos == pos:
             return
 
-        if pathfind_data.graph is None:
-            pathfind_data.graph = em.tilemap.get_graph(tiles.DEFAULT_TILE_WEIGHTS, BehaviourSystem.DELTAS_COST)
-
-        _, prev = pathfind_data.graph.pathfind(entity_pos, pos, heuristic=util.chebyshev_distance)
-        pathfind_data.plan = pathfind_data.graph.trace_path(prev, pos)
+        graph = em.tilemap.get_grid_graph(tiles.DEFAULT_TILE_WEIGHTS, BehaviourSystem.DELTAS_COST)
+        regions = em.tilemap.get_region_graph(BehaviourSystem.DELTAS_COST)
+        _, prev = regions.pathfind(graph, entity_pos, pos, heuristic=util.chebyshev_distance)
+        pathfind_data.plan = graph.trace_path(prev, pos)
 
         if len(pathfind_data.plan) < 2:
             return
@@ -67,6 +89,19 @@ class BehaviourSystem(ecs.System):
         em.add_components(entity, components.MovementActionComponent(*relative_target))
         del pathfind_data.plan[0]
 
+    def follow_goal_map(self, em: ecs.TilemapEcs, entity: ecs.Entity, goal_map: pathfinding.DijkstraMap):
+        '''
+        Like go_toward, but reads the next step from a precomputed Dijkstra map instead of running a search.
+        '''
+        entity_pos = em.get_pos(entity)
+        target = goal_map.next_step(entity_pos)
+
+        if target is None:
+            return
+
+        relative_target = util.top2(target, entity_pos, operator.sub)
+        em.add_components(entity, components.MovementActionComponent(*relative_target))
+
         
     def process_peaceful(self, em: ecs.TilemapEcs, peaceful: Iterable[ecs.Entity], player: ecs.Entity):
         for mover in peaceful:
@@ -85,28 +120,40 @@ class BehaviourSystem(ecs.System):
             return
         
         player_pos = em.get_pos(player)
+        chase_map = None
+        hostiles = list(hostiles)
+        in_range = [hostile for hostile in hostiles
+                    if util.distance(player_pos, em.get_pos(hostile)) <= hostile.get_component(em, components.SimpleHostileBehaviourComponent).sight_range]
+
+        # one batched line of sight query for everyone close enough to see the player
+        for hostile, sees_player in zip(in_range, em.tilemap.los.in_los_many((em.get_pos(hostile) for hostile in in_range), player_pos)):
+            if sees_player:
+                hostile.get_component(em, components.SimpleHostileBehaviourComponent).last_seen_player_position = player_pos
         
         for hostile in hostiles:
             hostile_pos = em.get_pos(hostile)
             hostile_behaviour: components.SimpleHostileBehaviourComponent = hostile.get_component(em, components.SimpleHostileBehaviourComponent)
-            pathfind_data: components.PathfindTargetComponent = hostile.get_component(em, components.PathfindTargetComponent)
-
-            if util.distance(player_pos, hostile_pos) <= hostile_behaviour.sight_range and em.tilemap.in_los(hostile_pos, player_pos):
-                hostile_behaviour.last_seen_player_position = player_pos
 
             if hostile_behaviour.last_seen_player_position is not None and hostile_pos != hostile_behaviour.last_seen_player_position:
-                self.go_toward(em, hostile, player_pos)                
+                if chase_map is None:
+                    chase_map = self.get_goal_map(em, [player_pos], BehaviourSystem.CHASE_MAP_RADIUS)
+
+                # the chase map only reaches CHASE_MAP_RADIUS around the player
+                if chase_map.get(hostile_pos) < float("inf"):
+                    self.follow_goal_map(em, hostile, chase_map)
+                else:
+                    self.go_toward(em, hostile, player_pos)
     
 
     def process(self, em: ecs.Ecs, event: events.BehaviourTickEvent):
         try:
-            player = em.query_single_with_component(components.PlayerControlComponent)
+            player = em.view(components.PlayerControlComponent).single()
             player_pos = em.get_pos(player)
         except KeyError:
             player = None
 
-        dumb_peaceful = em.query_all_with_components(components.DumbPeacefulBehaviourComponent)
+        dumb_peaceful = em.view(components.DumbPeacefulBehaviourComponent)
         self.process_peaceful(em, dumb_peaceful, player)
 
-        simple_hostile = em.query_all_with_components(components.SimpleHostileBehaviourComponent, components.PathfindTargetComponent)
+        simple_hostile = em.view(components.SimpleHostileBehaviourComponent, components.PathfindTargetComponent)
         self.process_hostile(simple_hostile, em, player)
\ No newline at end of file
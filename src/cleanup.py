@@ -1,5 +1,4 @@
 from typing import *
-import pygame
 from . import ecs
 from . import components
 from . import tiles
@@ -11,28 +10,45 @@ class CleanupDeadSystem(ecs.System):
     def __init__(self):
         pass
         
-    def process(self, em: ecs.TilemapEcs, event: events.AfterPhysicsTickEvent):
-        can_die = em.query_all_with_components(components.HealthComponent)
+    def find_dead(self, em: ecs.TilemapEcs) -> List[ecs.Entity]:
+        health_storage = em.get_columnar_storage(components.HealthComponent)
+
+        if health_storage is not None:
+            return health_storage.select(health_storage["health"] < 1)
+
         died = []
 
-        for entity in can_die:
+        for entity in em.view(components.HealthComponent):
             health: int = entity.get_component(em, components.HealthComponent).health
 
             if health < 1:
                 died.append(entity)
 
-        for dead in died:
-            dead_pos = em.get_pos(dead)
-            em.create_entity(dead_pos, *entity_definitions.corpse())
-            em.remove_entity(dead)
-            
-        can_expire = em.query_all_with_components(components.RealtimeLifetimeComponent)
+        return died
+
+    def find_expired(self, em: ecs.TilemapEcs, now: int) -> List[ecs.Entity]:
+        lifetime_storage = em.get_columnar_storage(components.RealtimeLifetimeComponent)
+
+        if lifetime_storage is not None:
+            return lifetime_storage.select(lifetime_storage["created"] + lifetime_storage["lifetime"] < now)
+
         expired = []
-        for entity in can_expire:
+
+        for entity in em.view(components.RealtimeLifetimeComponent):
             lifetime: components.RealtimeLifetimeComponent = entity.get_component(em, components.RealtimeLifetimeComponent)
             
-            if lifetime.created + lifetime.lifetime < pygame.time.get_ticks():
+            if lifetime.created + lifetime.lifetime < now:
                 expired.append(entity)
 
-        for entity in expired:
+        return expired
+
+    def process(self, em: ecs.TilemapEcs, event: events.AfterPhysicsTickEvent):
+        died = self.find_dead(em)
+
+        for dead in died:
+            dead_pos = em.get_pos(dead)
+            em.create_entity(dead_pos, *entity_definitions.corpse())
+            em.remove_entity(dead)
+            
+        for entity in self.find_expired(em, em.get_ticks()):
             em.remove_entity(entity)
\ No newline at end of file
@@ -0,0 +1,124 @@
+'''
+Opt-in struct-of-arrays storage for plain numeric components. No game specific logic goes here.
+
+Every field of a component type gets its own NumPy array, and entities are mapped to dense rows. Systems can then
+filter or update the whole population in a single array operation, while entity.get_component keeps working
+through a RowProxy.
+'''
+from __future__ import annotations
+
+from typing import *
+
+import numpy as np
+
+class RowProxy:
+    '''
+    Lightweight stand-in for a component whose data lives in a ColumnarStorage. Attribute reads and writes go
+    straight to the columns, so the proxy stays valid when rows are moved around by removals.
+    '''
+    __slots__ = ("_storage", "_entity")
+
+    def __init__(self, storage: ColumnarStorage, entity: Hashable):
+        object.__setattr__(self, "_storage", storage)
+        object.__setattr__(self, "_entity", entity)
+
+    def __getattr__(self, name: str) -> Any:
+        storage: ColumnarStorage = object.__getattribute__(self, "_storage")
+
+        if name not in storage.dtypes:
+            raise AttributeError(f"{storage.component_type.__name__} has no field {name}.")
+
+        return storage.get(self._entity, name)
+
+    def __setattr__(self, name: str, value: Any):
+        if name not in self._storage.dtypes:
+            raise AttributeError(f"{self._storage.component_type.__name__} has no field {name}.")
+
+        self._storage.set(self._entity, name, value)
+
+    def __iter__(self):
+        # mirrors the __iter__ of the dataclass components, so unpacking like dy, dx = movement keeps working
+        return iter([self._storage.get(self._entity, name) for name in self._storage.fields])
+
+    def __repr__(self) -> str:
+        values = ", ".join(f"{name}={self._storage.get(self._entity, name)!r}" for name in self._storage.fields)
+        return f"{self._storage.component_type.__name__}Row({values})"
+
+class ColumnarStorage:
+    '''
+    One NumPy array per field plus a dense entity to row map. Removal swaps the last row into the hole,
+    so the first len(self) rows are always the live ones.
+    '''
+    def __init__(self, component_type: Type, dtypes: Dict[str, Any], capacity: int = 64):
+        if not dtypes:
+            raise ValueError(f"Columnar storage for {component_type.__name__} needs at least one field.")
+
+        self.component_type = component_type
+        self.dtypes: Dict[str, np.dtype] = {name: np.dtype(dtype) for name, dtype in dtypes.items()}
+        self.fields: Tuple[str, ...] = tuple(self.dtypes)
+        self.entities: List[Hashable] = []
+        self._rows: Dict[Hashable, int] = {}
+        self._columns: Dict[str, np.ndarray] = {name: np.zeros(capacity, dtype) for name, dtype in self.dtypes.items()}
+
+    def __len__(self) -> int:
+        return len(self.entities)
+
+    def __contains__(self, entity: Hashable) -> bool:
+        return entity in self._rows
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        '''
+        Returns a view of the live part of the column. Writing into it writes into the storage.
+        The view is only valid until the next entity is added or removed.
+        '''
+        return self._columns[name][:len(self.entities)]
+
+    def _grow(self):
+        for name, column in self._columns.items():
+            grown = np.zeros(len(column) * 2, column.dtype)
+            grown[:len(column)] = column
+            self._columns[name] = grown
+
+    def add(self, entity: Hashable, component: Any) -> RowProxy:
+        '''
+        Copies the fields of component into a row for entity, overwriting the old row if there is one.
+
+        Returns: the proxy to store instead of the component
+        '''
+        if entity not in self._rows:
+            if len(self.entities) == len(self._columns[self.fields[0]]):
+                self._grow()
+
+            self._rows[entity] = len(self.entities)
+            self.entities.append(entity)
+
+        row = self._rows[entity]
+
+        for name in self.fields:
+            self._columns[name][row] = getattr(component, name)
+
+        return RowProxy(self, entity)
+
+    def remove(self, entity: Hashable):
+        row = self._rows.pop(entity)
+        last = len(self.entities) - 1
+        last_entity = self.entities.pop()
+
+        if row != last:
+            for column in self._columns.values():
+                column[row] = column[last]
+
+            self.entities[row] = last_entity
+            self._rows[last_entity] = row
+
+    def get(self, entity: Hashable, name: str) -> Any:
+        return self._columns[name][self._rows[entity]].item()
+
+    def set(self, entity: Hashable, name: str, value: Any):
+        self._columns[name][self._rows[entity]] = value
+
+    def select(self, mask: np.ndarray) -> List[Hashable]:
+        '''
+        Converts a boolean mask over the live rows (e.g. storage["health"] < 1) into the matching entities.
+        '''
+        return [self.entities[row] for row in np.flatnonzero(mask)]
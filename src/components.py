@@ -3,6 +3,8 @@ from typing import *
 from enum import Enum, auto
 from dataclasses import dataclass, asdict
 
+import numpy as np
+
 from . import tiles
 from . import ecs
 from . import util
@@ -22,19 +24,44 @@ class UITextComponent(ecs.Component):
 
 @dataclass
 class PathfindTargetComponent(ecs.Component):
-    graph: util.Graph = None
     plan: List[Tuple[int, int]] = None
 
 
 class PlayerControlComponent(ecs.Component):
     def __init__(self):
-        self.visible: Set[Tuple[int, int]] = set()
-        self.discovered: Set[Tuple[int, int]] = set()
+        # boolean masks with the shape of the tilemap, allocated by resize on the first visibility update
+        self.visible: np.ndarray = None
+        self.discovered: np.ndarray = None
+        self.newly_discovered: np.ndarray = None
+        # bumped on every visibility update, so renderers can tell when the masks changed
+        self.visibility_version: int = 0
 
         self.do_autowalk: bool = False
         self.autowalk_plan: List[Tuple[int, int]] = None
         self.autowalk_timer: int = 0
 
+    def resize(self, dims: Tuple[int, int]):
+        '''
+        (Re)allocate the visibility masks for a map of the given dimensions, forgetting everything seen so far.
+        '''
+        self.visible = np.zeros(dims, dtype=bool)
+        self.discovered = np.zeros(dims, dtype=bool)
+        self.newly_discovered = np.zeros(dims, dtype=bool)
+
+    def _test(self, mask: np.ndarray, pos: Tuple[int, int]) -> bool:
+        if mask is None:
+            return False
+
+        y, x = pos
+        height, width = mask.shape
+        return 0 <= y < height and 0 <= x < width and bool(mask[y, x])
+
+    def is_visible(self, pos: Tuple[int, int]) -> bool:
+        return self._test(self.visible, pos)
+
+    def is_discovered(self, pos: Tuple[int, int]) -> bool:
+        return self._test(self.discovered, pos)
+
 @dataclass
 class MovementActionComponent(ecs.Component):
     dy: int = 0
@@ -104,4 +131,19 @@ class PickupComponent:
 class BarTextComponent:
     text: str = "Not set."
     color: Tuple[int, int, int] = (255, 255, 255)
-    font: str = os.path.join("res", "fonts", "alagard.ttf")
\ No newline at end of file
+    font: str = os.path.join("res", "fonts", "alagard.ttf")
+
+# plain numeric components that are stored as one NumPy array per field
+COLUMNAR_COMPONENTS: Dict[Type, Dict[str, Any]] = {
+    HealthComponent: {"max_health": np.int32, "health": np.int32},
+    MeleeAttackComponent: {"damage": np.int32},
+    MovementActionComponent: {"dy": np.int8, "dx": np.int8},
+    RealtimeLifetimeComponent: {"created": np.int64, "lifetime": np.int64},
+}
+
+def enable_columnar_storage(em: ecs.Ecs):
+    '''
+    Store the COLUMNAR_COMPONENTS in columns, the way the game does. Everything that builds a game world should call this.
+    '''
+    for component_type, field_dtypes in COLUMNAR_COMPONENTS.items():
+        em.enable_columnar_storage(component_type, **field_dtypes)
@@ -1,12 +1,24 @@
 import os
 import pygame
 from . import components
+from . import ecs
+from . import events
+from . import tiles
 
 DUNGEON_DIMS = 32, 32
 SCALE = 32
 WINDOW_DIMS = DUNGEON_DIMS[1] * SCALE, DUNGEON_DIMS[0] * SCALE + 40
 TARGET_FPS = 60
 RESOURCES_PATH = "res"
+# seed of the whole run of levels, None for a different run every time
+LEVEL_SEED = None
+# generated levels are cached on disk only when LEVEL_SEED is set, random runs never repeat a level
+LEVEL_CACHE_PATH = ".levelcache"
+LEVEL_CACHE_MAX_BYTES = 32 * 1024 * 1024
+# how rooms are connected, tiles.CORRIDORS_SPANNING_TREE generates much faster and adds CORRIDOR_EXTRA_LOOPS loops,
+# but makes differently shaped levels
+CORRIDOR_STRATEGY = tiles.CORRIDORS_SEQUENTIAL
+CORRIDOR_EXTRA_LOOPS = 0
 KEY_MAP = {
     pygame.K_SPACE: components.IdleActionComponent(),
     pygame.K_UP: components.MovementActionComponent(-1, 0),
@@ -14,3 +26,15 @@ KEY_MAP = {
     pygame.K_RIGHT: components.MovementActionComponent(0, 1),
     pygame.K_LEFT: components.MovementActionComponent(0, -1)
 }
+# queue events and dispatch them once per frame, merging redundant ones as described by EVENT_COALESCING.
+# Off by default, it changes the turn order: coalesced GamestepEvents mean at most one turn per frame, and events
+# emitted by a system only reach other systems after the current round of dispatch.
+QUEUED_DISPATCH = False
+EVENT_COALESCING = {
+    events.UserHoversTileWithMouseEvent: ecs.COALESCE_LAST,
+    events.GamestepEvent: ecs.COALESCE_ONCE,
+    events.LoadNextDungeonEvent: ecs.COALESCE_ONCE,
+}
+# switches per system profiling and its overlay on and off
+PROFILER_TOGGLE_KEY = pygame.K_F3
+PROFILER_OVERLAY_ROWS = 8
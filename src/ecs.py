@@ -7,8 +7,12 @@ from __future__ import annotations
 from typing import *
 from dataclasses import field, dataclass
 from abc import ABC, abstractmethod
+import time
 
 from . import tiles
+from . import columnar
+from . import stencils
+from . import profiling
 
 @dataclass
 class Entity:
@@ -41,6 +45,80 @@ class System(ABC):
     def process(self, entity_manager: Ecs, event: Event):
         pass
 
+    def process_batch(self, entity_manager: Ecs, events: List[Event]):
+        '''
+        Called with all queued events of one type at once when the Ecs uses queued dispatch.
+        Override this if a batch can be handled faster than one event at a time.
+        '''
+        for event in events:
+            self.process(entity_manager, event)
+
+# coalescing rules for queued dispatch: only the last queued event of a type is kept, or only the first one
+COALESCE_LAST = "last"
+COALESCE_ONCE = "once"
+
+class QueryView:
+    '''
+    Persistent view of all entities that have all of the given component types. The Ecs keeps it up to date
+    as entities and components are added or removed, so iterating it never scans the world.
+    Get one via Ecs.view instead of constructing it directly.
+    '''
+    def __init__(self, entity_manager: Ecs, component_types: FrozenSet[Type]):
+        self.entity_manager = entity_manager
+        self.component_types = component_types
+        self._entities: Dict[Entity, None] = {}
+        self._on_enter: List[Callable[[Ecs, Entity], None]] = []
+        self._on_exit: List[Callable[[Ecs, Entity], None]] = []
+
+    def subscribe(self, on_enter: Callable[[Ecs, Entity], None] = None, on_exit: Callable[[Ecs, Entity], None] = None):
+        '''
+        Register callbacks that are called with (entity_manager, entity) when an entity enters or leaves the view.
+        on_exit is called before the component is actually removed, so it can still be read.
+        '''
+        if on_enter is not None:
+            self._on_enter.append(on_enter)
+
+        if on_exit is not None:
+            self._on_exit.append(on_exit)
+
+    def unsubscribe(self, on_enter: Callable[[Ecs, Entity], None] = None, on_exit: Callable[[Ecs, Entity], None] = None):
+        if on_enter is not None:
+            self._on_enter.remove(on_enter)
+
+        if on_exit is not None:
+            self._on_exit.remove(on_exit)
+
+    def single(self) -> Entity:
+        '''
+        Fast path for views that are meant to only ever contain one entity, like the player.
+        '''
+        for entity in self._entities:
+            return entity
+
+        raise KeyError(f"Failed query for {set(self.component_types)}, no entity with these component types exists.")
+
+    def _enter(self, entity: Entity):
+        self._entities[entity] = None
+
+        for callback in self._on_enter:
+            callback(self.entity_manager, entity)
+
+    def _exit(self, entity: Entity):
+        for callback in self._on_exit:
+            callback(self.entity_manager, entity)
+
+        del self._entities[entity]
+
+    def __iter__(self) -> Iterator[Entity]:
+        # copied so that systems can add and remove components while iterating
+        return iter(list(self._entities))
+
+    def __len__(self) -> int:
+        return len(self._entities)
+
+    def __contains__(self, entity: Entity) -> bool:
+        return entity in self._entities
+
 class Ecs:
     '''
     (Usually) singleton object central to the entity component system.
@@ -52,6 +130,20 @@ class Ecs:
         self._id_counter = 0
         self._position_to_entity: Dict[Tuple[int, int], Set[Entity]] = {}
         self._entity_to_position: Dict[Entity, Tuple[int, int]]= {}
+        # Dicts are used as insertion ordered sets here, so query results come out in a deterministic order.
+        self._component_index: Dict[Type, Dict[Entity, None]] = {}
+        self._views: Dict[FrozenSet[Type], QueryView] = {}
+        self._views_by_component: Dict[Type, List[QueryView]] = {}
+        self._columnar: Dict[Type, columnar.ColumnarStorage] = {}
+        # None while profiling is off, so emit_event only pays for one attribute check
+        self.profiler: profiling.Profiler = None
+        self._last_profiler: profiling.Profiler = None
+        # queued events while queued dispatch is on, None otherwise
+        self._queue: List[Event] = None
+        # position in the queue of the queued event of every coalesced type
+        self._coalesced_positions: Dict[Type, int] = {}
+        self.coalescing: Dict[Type, str] = {}
+        self.max_drain_rounds = 1000
 
     def _next_id(self) -> int:
         # If the id counter becomes very large then this might kill performance, but in practise this will
@@ -77,15 +169,100 @@ class Ecs:
         for identifier in event_types:
             self.systems[identifier].remove(system)
 
-    def emit_event(self, event: Event):
+    def emit_event(self, event: Event, immediate: bool = False):
         '''
         Emits the given event to all systems registered for it, calling the system.process method.
+        With queued dispatch the event is only queued until the next drain_events, unless immediate is set.
         '''
+        if self._queue is not None and not immediate:
+            self._enqueue(event)
+            return
+
         recipients = self.systems.get(type(event), [])
+        profiler = self.profiler
+
+        if profiler is not None:
+            for system in recipients:
+                profiler.call(self, system, event)
+
+            return
 
         for system in recipients:
             system.process(self, event)
 
+    def _enqueue(self, event: Event):
+        event_type = type(event)
+        rule = self.coalescing.get(event_type)
+
+        if rule is None:
+            self._queue.append(event)
+            return
+
+        position = self._coalesced_positions.get(event_type)
+
+        if position is None:
+            self._coalesced_positions[event_type] = len(self._queue)
+            self._queue.append(event)
+        elif rule == COALESCE_LAST:
+            self._queue[position] = event
+
+    def set_queued_dispatch(self, enabled: bool, coalescing: Dict[Type, str] = None):
+        '''
+        In queued dispatch mode emit_event only queues events, and drain_events dispatches them, e.g. once per frame.
+        coalescing maps event types to COALESCE_LAST or COALESCE_ONCE, to merge redundant events of that type
+        that are waiting in the queue. Switching queued dispatch off drains the queue first.
+        '''
+        if coalescing is not None:
+            self.coalescing = dict(coalescing)
+
+        if enabled and self._queue is None:
+            self._queue = []
+            self._coalesced_positions = {}
+        elif not enabled and self._queue is not None:
+            self.drain_events()
+            self._queue = None
+
+    def drain_events(self):
+        '''
+        Dispatch the queued events in rounds. Every round takes the whole queue and groups it by event type, in the
+        order the types were first queued, then every system gets its whole batch of one type in a single
+        process_batch call. Events emitted meanwhile go into the next round.
+        Does nothing without queued dispatch.
+        '''
+        rounds = 0
+
+        while self._queue:
+            rounds += 1
+
+            if rounds > self.max_drain_rounds:
+                raise RuntimeError(f"Events still queued after {self.max_drain_rounds} rounds, systems keep emitting events for each other.")
+
+            queue, self._queue = self._queue, []
+            self._coalesced_positions = {}
+            batches: Dict[Type, List[Event]] = {}
+
+            for event in queue:
+                batches.setdefault(type(event), []).append(event)
+
+            for event_type, batch in batches.items():
+                for system in list(self.systems.get(event_type, [])):
+                    if self.profiler is not None:
+                        self.profiler.call_batch(self, system, event_type, batch)
+                    else:
+                        system.process_batch(self, batch)
+
+    def set_profiling(self, enabled: bool) -> profiling.Profiler:
+        '''
+        Switch per system profiling on or off, see profiling.Profiler. Switching it on again keeps the collected stats.
+        Returns the profiler, which stays readable after profiling was switched off.
+        '''
+        if enabled and self.profiler is None:
+            self.profiler = self._last_profiler or profiling.Profiler()
+        elif not enabled and self.profiler is not None:
+            self._last_profiler, self.profiler = self.profiler, None
+
+        return self.profiler or self._last_profiler
+
     def create_entity(self, pos: Tuple[int, int], *components, identifier: Hashable=None) -> Entity:
         '''
         Create a new entity containing the components specified. Identifier must be unique for each entity.
@@ -99,8 +276,8 @@ class Ecs:
         if identifier in self.entities:
             raise ValueError(f"Entity with identifier {identifier} already exists.")
 
-        components = {type(c) : c for c in components}
         entity = Entity(identifier)
+        components = {type(c) : self._store_component(entity, c) for c in components}
         self.entities[entity] = components
 
         if pos in self._position_to_entity:
@@ -109,15 +286,101 @@ class Ecs:
             self._position_to_entity[pos] = set([entity])
 
         self._entity_to_position[entity] = pos
+
+        # indexed last so that view callbacks see a fully constructed entity
+        for component_type in components:
+            self._index_component(entity, component_type)
         
         return entity
     
     def remove_entity(self, entity: Entity):
+        for component_type in list(self.entities[entity]):
+            self._unindex_component(entity, component_type)
+
+            if component_type in self._columnar:
+                self._columnar[component_type].remove(entity)
+
         pos = self._entity_to_position[entity]
         self._position_to_entity[pos].remove(entity)
         del self._entity_to_position[entity]
         del self.entities[entity]
+
+    def enable_columnar_storage(self, component_type: Type, **field_dtypes: Any) -> columnar.ColumnarStorage:
+        '''
+        Opt in to struct of arrays storage for a plain numeric component type, e.g.
+        enable_columnar_storage(HealthComponent, max_health=np.int32, health=np.int32).
+        Existing components of that type are moved into the storage.
+        entity.get_component then returns a RowProxy instead of the original component object.
+        '''
+        if component_type in self._columnar:
+            raise ValueError(f"Columnar storage for {component_type.__name__} is already enabled.")
+
+        storage = columnar.ColumnarStorage(component_type, field_dtypes)
+        self._columnar[component_type] = storage
+
+        for entity in self._component_index.get(component_type, ()):
+            components = self.entities[entity]
+            components[component_type] = storage.add(entity, components[component_type])
+
+        return storage
+
+    def get_columnar_storage(self, component_type: Type) -> Optional[columnar.ColumnarStorage]:
+        '''
+        Returns the columnar storage for vectorized queries over a component type, or None if it was not enabled.
+        '''
+        return self._columnar.get(component_type)
+
+    def _store_component(self, entity: Entity, component: Any) -> Any:
+        storage = self._columnar.get(type(component))
+
+        if storage is None:
+            return component
+
+        return storage.add(entity, component)
+
+    def _index_component(self, entity: Entity, component_type: Type):
+        if component_type not in self._component_index:
+            self._component_index[component_type] = {}
+
+        self._component_index[component_type][entity] = None
+
+        for view in self._views_by_component.get(component_type, ()):
+            if entity not in view and view.component_types <= self.entities[entity].keys():
+                view._enter(entity)
+
+    def _unindex_component(self, entity: Entity, component_type: Type):
+        for view in self._views_by_component.get(component_type, ()):
+            if entity in view:
+                view._exit(entity)
+
+        del self._component_index[component_type][entity]
+
+    def view(self, *component_types: Type) -> QueryView:
+        '''
+        Returns the live view for the given component signature. Views are created once per signature and shared,
+        so it is cheap to call this every frame.
+        '''
+        if not component_types:
+            raise ValueError("A view needs at least one component type.")
+
+        key = frozenset(component_types)
+
+        if key in self._views:
+            return self._views[key]
         
+        view = QueryView(self, key)
+
+        for entity in self.query_all_with_components(*key):
+            view._entities[entity] = None
+
+        for component_type in key:
+            if component_type not in self._views_by_component:
+                self._views_by_component[component_type] = []
+
+            self._views_by_component[component_type].append(view)
+
+        self._views[key] = view
+        return view
 
     def move_entity(self, entity: Entity, target: Tuple[int, int]):
         '''
@@ -143,22 +406,40 @@ class Ecs:
     
     def query_all_with_components(self, *component_types) -> Generator[Entity, None, None]:
         '''
-        Queries all entities that have all of the specified components.
+        Queries all entities that have all of the specified components. Starts from the smallest
+        per component index and intersects from there, so the cost depends on the number of matches
+        and not on the number of entities.
         '''
-        # TODO: Improve the performance of this query if the current implementation is not fast enough.
-        return self.query_entities(lambda em, entity: set(component_types) <= em.get_components(entity).keys())
+        if not component_types:
+            return (entity for entity in list(self.entities))
+
+        indices = []
+
+        for component_type in component_types:
+            index = self._component_index.get(component_type)
+
+            if not index:
+                return (entity for entity in ())
+
+            indices.append(index)
+
+        indices.sort(key=len)
+        smallest, rest = indices[0], indices[1:]
+
+        # the result is materialized first so callers can add or remove components while iterating
+        result = [entity for entity in smallest if all(entity in index for index in rest)]
+        return (entity for entity in result)
     
     def query_single_with_component(self, component_type) -> Entity:
         '''
         Meant for cases where only one entity that has the specified component exists.
         '''
-        # TODO: Improve the performance of this query if the current implementation is not fast enough.
-        result = list(self.query_all_with_components(component_type))
+        index = self._component_index.get(component_type)
         
-        if not result:
+        if not index:
             raise KeyError(f"Failed query for {component_type}, no entity for this component type exists.")
 
-        return result[0]    
+        return next(iter(index))
     
     def get_entities_at(self, pos: Tuple[int, int]) -> Set[Entity]:
         '''
@@ -179,12 +460,17 @@ class Ecs:
     
     def add_components(self, entity: Entity, *components: Any):
         for component in components:
-            self.get_components(entity)[type(component)] = component
+            self.get_components(entity)[type(component)] = self._store_component(entity, component)
+            self._index_component(entity, type(component))
     
     def remove_components(self, entity: Entity, *component_types: Type):
         for component_type in component_types:
+            self._unindex_component(entity, component_type)
             del self.get_components(entity)[component_type]
 
+            if component_type in self._columnar:
+                self._columnar[component_type].remove(entity)
+
     def __getitem__(self, identifier):
         return self.entities[identifier]
     
@@ -192,9 +478,34 @@ class TilemapEcs(Ecs):
     '''
     (Usually) singleton object central to the entity component system. This one comes with an included tilemap.
     It stores entities and components and calls systems via events. It also stores and manages the tilemap.
+    get_ticks is the game clock in milliseconds, by default the time since creation. The game passes pygame's clock,
+    simulations can pass their own.
     '''
-    def __init__(self, tilemap: tiles.Tilemap):
+    def __init__(self, tilemap: tiles.Tilemap, get_ticks: Callable[[], int] = None):
         super().__init__()
         self.tilemap: tiles.Tilemap = tilemap
+
+        if get_ticks is None:
+            start = time.monotonic()
+            get_ticks = lambda: int((time.monotonic() - start) * 1000)
+
+        self.get_ticks: Callable[[], int] = get_ticks
+
+    def get_entities_in_radius(self, pos: Tuple[int, int], radius: float, metric: str = stencils.EUCLIDEAN) -> Set[Entity]:
+        '''
+        Return a set of all entities within radius of pos. Depending on which is smaller, this either looks up every
+        position of the radius stencil or checks the position of every entity.
+        '''
+        result = set()
+
+        if len(self._entity_to_position) < stencils.get_stencil(radius, metric).size:
+            for entity, entity_pos in self._entity_to_position.items():
+                if stencils.is_within(entity_pos, pos, radius, metric):
+                    result.add(entity)
+        else:
+            for y, x in stencils.positions_in_radius(pos, radius, self.tilemap.dims, metric).tolist():
+                result.update(self.get_entities_at((y, x)))
+
+        return result
     
     
\ No newline at end of file
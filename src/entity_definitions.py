@@ -3,8 +3,6 @@ Finished component collections to add to the game world.
 '''
 from typing import *
 import os
-import pygame
-from . import configuration
 from . import ecs
 from . import components
 
@@ -38,13 +36,13 @@ def corpse() -> Iterable[ecs.Component]:
         )
         
 
-def hitmarker(damage) -> Iterable[ecs.Component]:
+def hitmarker(damage, created: int) -> Iterable[ecs.Component]:
     return (components.FloatingTextComponent(str(damage), (255, 0, 0, 100)),
-            components.RealtimeLifetimeComponent(pygame.time.get_ticks(), 500))
+            components.RealtimeLifetimeComponent(created, 500))
 
-def healmarker(healing) -> Iterable[ecs.Component]:
+def healmarker(healing, created: int) -> Iterable[ecs.Component]:
     return (components.FloatingTextComponent(str(healing), (0, 255, 0, 100)),
-            components.RealtimeLifetimeComponent(pygame.time.get_ticks(), 500))
+            components.RealtimeLifetimeComponent(created, 500))
 
 
 
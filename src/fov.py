@@ -0,0 +1,113 @@
+'''
+Field of view. The default algorithm is symmetric recursive shadowcasting over the tilemap's LOS blocker mask,
+which finds every visible tile in one pass over the disc. The old per tile Bresenham check is kept as a selectable
+algorithm so results can be compared.
+'''
+from typing import *
+
+import numpy as np
+
+from . import tiles
+
+SHADOWCAST = "shadowcast"
+BRESENHAM = "bresenham"
+
+# (row, col) in octant space to (dy, dx) on the map, for the four quadrants north, east, south and west
+_QUADRANTS = (
+    lambda row, col: (-row, col),
+    lambda row, col: (col, row),
+    lambda row, col: (row, col),
+    lambda row, col: (col, -row),
+)
+
+def _round_ties_up(depth: int, slope: Tuple[int, int]) -> int:
+    # floor(depth * slope + 1/2), slopes are kept as exact (numerator, denominator) pairs
+    numerator, denominator = slope
+    return (2 * depth * numerator + denominator) // (2 * denominator)
+
+def _round_ties_down(depth: int, slope: Tuple[int, int]) -> int:
+    # ceil(depth * slope - 1/2)
+    numerator, denominator = slope
+    return -((denominator - 2 * depth * numerator) // (2 * denominator))
+
+def _tile_slope(depth: int, col: int) -> Tuple[int, int]:
+    return 2 * col - 1, 2 * depth
+
+def shadowcast(tilemap: tiles.Tilemap, origin: Tuple[int, int], radius: float) -> Set[Tuple[int, int]]:
+    '''
+    Symmetric shadowcasting: if a tile can see another tile, the other tile can also see it.
+    Tiles outside of the map block sight and are never returned.
+    '''
+    blockers = tilemap.los_blocker_mask
+    height, width = tilemap.dims
+    origin_y, origin_x = origin
+    radius_squared = radius * radius
+    visible = {origin}
+
+    for transform in _QUADRANTS:
+        rows = [(1, (-1, 1), (1, 1))]
+
+        while rows:
+            depth, start_slope, end_slope = rows.pop()
+
+            if depth > radius:
+                continue
+
+            prev_blocked = None
+
+            for col in range(_round_ties_up(depth, start_slope), _round_ties_down(depth, end_slope) + 1):
+                dy, dx = transform(depth, col)
+                y, x = origin_y + dy, origin_x + dx
+                in_bounds = 0 <= y < height and 0 <= x < width
+                blocked = not in_bounds or bool(blockers[y, x])
+
+                if in_bounds and dy * dy + dx * dx <= radius_squared:
+                    # floors are only revealed if they are symmetric, i.e. inside the row's slopes
+                    start_num, start_den = start_slope
+                    end_num, end_den = end_slope
+
+                    if blocked or (col * start_den >= depth * start_num and col * end_den <= depth * end_num):
+                        visible.add((y, x))
+
+                if prev_blocked and not blocked:
+                    start_slope = _tile_slope(depth, col)
+
+                if prev_blocked is False and blocked:
+                    rows.append((depth + 1, start_slope, _tile_slope(depth, col)))
+
+                prev_blocked = blocked
+
+            if prev_blocked is False:
+                rows.append((depth + 1, start_slope, end_slope))
+
+    return visible
+
+def bresenham(tilemap: tiles.Tilemap, origin: Tuple[int, int], radius: float) -> Set[Tuple[int, int]]:
+    '''
+    The original algorithm, a separate Bresenham line of sight check for every tile in the radius.
+    '''
+    return {pos for pos in tilemap.iterate_radius(origin, radius) if tilemap.in_los(origin, pos)}
+
+ALGORITHMS: Dict[str, Callable[[tiles.Tilemap, Tuple[int, int], float], Set[Tuple[int, int]]]] = {
+    SHADOWCAST: shadowcast,
+    BRESENHAM: bresenham,
+}
+
+def compute_fov(tilemap: tiles.Tilemap, origin: Tuple[int, int], radius: float, algorithm: str = SHADOWCAST) -> Set[Tuple[int, int]]:
+    '''
+    Returns the set of all tiles visible from origin within radius.
+    '''
+    return ALGORITHMS[algorithm](tilemap, origin, radius)
+
+def compute_fov_mask(tilemap: tiles.Tilemap, origin: Tuple[int, int], radius: float, algorithm: str = SHADOWCAST, out: np.ndarray = None) -> np.ndarray:
+    '''
+    Like compute_fov, but returns a boolean mask with the shape of the tilemap. If out is given, it is overwritten in place.
+    '''
+    if out is None:
+        out = np.zeros(tilemap.dims, dtype=bool)
+    else:
+        out[...] = False
+
+    visible = compute_fov(tilemap, origin, radius, algorithm)
+    out[tuple(np.array(list(visible)).T)] = True
+    return out
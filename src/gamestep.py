@@ -14,7 +14,7 @@ class GamestepSystem(ecs.System):
         pass
 
     def pos_is_free(self, em: ecs.TilemapEcs, pos: Tuple[int, int]):
-        return em.tilemap.pos_is_in_bounds((pos)) and not em.tilemap[pos].is_collider() and not any(e.has_component(em, components.CollisionComponent) for e in em.get_entities_at(pos))
+        return em.tilemap.pos_is_in_bounds((pos)) and not em.tilemap.is_collider(pos) and not any(e.has_component(em, components.CollisionComponent) for e in em.get_entities_at(pos))
 
     def process(self, em: ecs.TilemapEcs, event: events.GamestepEvent):
         assert(type(event) == events.GamestepEvent)
@@ -3,12 +3,15 @@ from typing import *
 import os
 import pygame
 import functools
+import numpy as np
 from dataclasses import dataclass, asdict
 
 from . import tiles
 from . import ecs
 from . import components
 from . import util
+from . import profiling
+from . import atlas
 
 TILE_TO_IMG = {
     tiles.Tile.EMPTY: os.path.join("res", "imgs", "empty.png"),
@@ -17,147 +20,257 @@ TILE_TO_IMG = {
 
 class GraphicsSystem(ecs.System):
     SPRITE_QUERY_COMPONENTS = {components.SpriteComponent}
+    # what a cell of the tile layer shows, stored together with the tile value as tile value * 3 + category
+    HIDDEN, FOG, VISIBLE = 0, 1, 2
+    # with more dirty rectangles than this, updating the whole display is cheaper
+    MAX_DIRTY_RECTS = 256
 
-    def __init__(self, resources, window_dimensions=(800, 600), tile_scale=16):
+    def __init__(self, resources, window_dimensions=(800, 600), tile_scale=16, profiler_overlay_rows=0):
         self.resources = resources
+        # number of systems listed in the profiler overlay while profiling is on, 0 to never draw it
+        self.profiler_overlay_rows = profiler_overlay_rows
+        self._overlay_font: pygame.font.Font = None
         self.scr = pygame.display.set_mode(window_dimensions)
+        # every image and its fog variant, converted to the display format once
+        self.atlas = atlas.SpriteAtlas(resources)
         self.tile_scale = tile_scale
+        self._sprite_view: ecs.QueryView = None
+        self._draw_order: List[ecs.Entity] = None
+        # the tiles and fog of war composited over the whole window, only redrawn where cells changed
+        self._tile_layer: pygame.Surface = None
+        self._layer_states: np.ndarray = None
+        self._layer_key: Tuple = None
+        # screen areas drawn over the tile layer last frame, they are restored from the layer in the next one
+        self._dynamic_rects: List[pygame.Rect] = []
+
+    def _invalidate_draw_order(self, em: ecs.Ecs, entity: ecs.Entity):
+        self._draw_order = None
+
+    def get_draw_order(self, em: ecs.Ecs) -> List[ecs.Entity]:
+        '''
+        All drawable entities sorted by z index. Only resorted when entities enter or leave the sprite view.
+        '''
+        view = em.view(*GraphicsSystem.SPRITE_QUERY_COMPONENTS)
+
+        if view is not self._sprite_view:
+            if self._sprite_view is not None:
+                self._sprite_view.unsubscribe(self._invalidate_draw_order, self._invalidate_draw_order)
+
+            view.subscribe(self._invalidate_draw_order, self._invalidate_draw_order)
+            self._sprite_view = view
+            self._draw_order = None
+
+        if self._draw_order is None:
+            sorting_function = functools.partial(self._entity_sort, em)
+            self._draw_order = sorted(view, key=sorting_function) # sort according to z index
+
+        return self._draw_order
 
     @staticmethod
     def _entity_sort(entity_manager: ecs.Ecs, entity: ecs.Entity) -> int:
         return entity_manager.get_components(entity)[components.SpriteComponent].z_index
     
-    def draw_entity(self, em: ecs.TilemapEcs, entity: ecs.Entity, visibility: Set[Tuple[int, int]] = None):
+    def draw_entity(self, em: ecs.TilemapEcs, entity: ecs.Entity, visibility: Set[Tuple[int, int]] = None) -> pygame.Rect:
         y_pos, x_pos = em.get_pos(entity)
-        img = self.resources[em.get_components(entity)[components.SpriteComponent].img_key]
-        self.scr.blit(img, (x_pos * self.tile_scale, y_pos * self.tile_scale))
+        img_key = em.get_components(entity)[components.SpriteComponent].img_key
+        return self.atlas.blit(self.scr, img_key, (x_pos * self.tile_scale, y_pos * self.tile_scale))
 
-    def draw_tile(self, tile: tiles.Tile, pos: Tuple[int, int], fog_of_war_filter=False):
+    def draw_tile(self, tile: tiles.Tile, pos: Tuple[int, int], fog_of_war_filter=False, surface: pygame.Surface = None) -> pygame.Rect:
         y, x = pos
         screen_pos = x * self.tile_scale, y * self.tile_scale
-        img = self.resources[tile.get_image_key()]
+        variant = atlas.FOG if fog_of_war_filter else atlas.NORMAL
+        return self.atlas.blit(surface or self.scr, tile.get_image_key(), screen_pos, variant)
+
+    def get_cell_states(self, tilemap: tiles.Tilemap, pc: components.PlayerControlComponent = None) -> np.ndarray:
+        if pc is None:
+            category = GraphicsSystem.VISIBLE
+        elif pc.visible is None:
+            # no visibility computed yet means nothing was seen so far, like is_visible
+            category = GraphicsSystem.HIDDEN
+        else:
+            category = np.where(pc.visible, GraphicsSystem.VISIBLE, np.where(pc.discovered, GraphicsSystem.FOG, GraphicsSystem.HIDDEN))
+
+        return tilemap.cells.astype(np.int16) * 3 + category
+
+    def update_tile_layer(self, tilemap: tiles.Tilemap, pc: components.PlayerControlComponent = None) -> Optional[List[pygame.Rect]]:
+        '''
+        Redraw the cells of the tile layer whose tile or visibility changed since the last call.
+
+        Returns: the screen rectangles of the redrawn cells, or None if the whole layer was rebuilt
+        '''
+        key = id(tilemap), tilemap.version, None if pc is None else (id(pc), pc.visibility_version)
 
-        if not fog_of_war_filter:
-            self.scr.blit(img, screen_pos)
+        if key == self._layer_key:
+            return []
+
+        self._layer_key = key
+        states = self.get_cell_states(tilemap, pc)
+        rebuild = self._tile_layer is None or self._layer_states is None or self._layer_states.shape != states.shape
+
+        if rebuild:
+            self._tile_layer = pygame.Surface(self.scr.get_size()).convert()
+            self._tile_layer.fill((0, 0, 0))
+            changed = np.argwhere(np.ones(states.shape, dtype=bool))
         else:
-            self.scr.blit(pygame.transform.grayscale(img), screen_pos)
+            changed = np.argwhere(states != self._layer_states)
+
+        self._layer_states = states
+        hidden_img = self.atlas.get(os.path.join("res", "imgs", "hidden.png"))
+        rects = []
 
+        for y, x in changed.tolist():
+            tile_value, category = divmod(int(states[y, x]), 3)
+            # the images have transparent pixels, so the cell's previous image has to go first
+            self._tile_layer.fill((0, 0, 0), (x * self.tile_scale, y * self.tile_scale, self.tile_scale, self.tile_scale))
 
+            if category == GraphicsSystem.HIDDEN:
+                rects.append(self._tile_layer.blit(hidden_img, (x * self.tile_scale, y * self.tile_scale)))
+            else:
+                rects.append(self.draw_tile(tiles.TILES_BY_VALUE[tile_value], (y, x), category == GraphicsSystem.FOG, self._tile_layer))
 
-    def draw_tilemap(self, tilemap: tiles.Tilemap, visiblity: Set[Tuple[int, int]] = None, discovered: Set[Tuple[int, int]] = None):
-        height, width = tilemap.dims
+        return None if rebuild else rects
 
-        for y in range(height):
-            for x in range(width):
-                tile = tilemap[y, x]
-                self.draw_tile(tile, (y, x))
-    
-    def draw_tilemap_with_visibility(self, tilemap: tiles.Tilemap, visiblity: Set[Tuple[int, int]], discovered: Set[Tuple[int, int]]):
-        height, width = tilemap.dims
-        hidden_img = self.resources[os.path.join("res", "imgs", "hidden.png")]
-
-        for y in range(height):
-            for x in range(width):
-                if (y, x) in visiblity:
-                    tile = tilemap[y, x]
-                    self.draw_tile(tile, (y, x))
-                elif (y, x) in discovered:
-                    tile = tilemap[y, x]
-                    self.draw_tile(tile, (y, x), fog_of_war_filter=True)
-                else:
-                    screen_pos = x * self.tile_scale, y * self.tile_scale
-                    self.scr.blit(hidden_img, screen_pos)
-
-                
-    def draw_path_preview(self, em: ecs.Ecs, path: List[Tuple[int, int]]):
-        img = self.resources[os.path.join("res", "imgs", "path_tile.png")]
+    def draw_path_preview(self, em: ecs.Ecs, path: List[Tuple[int, int]]) -> List[pygame.Rect]:
+        img = self.atlas.get(os.path.join("res", "imgs", "path_tile.png"))
+        rects = []
         for y, x in path:
             screen_pos = x * self.tile_scale, y * self.tile_scale
-            self.scr.blit(img, screen_pos)
+            rects.append(self.scr.blit(img, screen_pos))
+        return rects
 
-    def draw_debug_square(self, em: ecs.TilemapEcs, pos: Tuple[int, int]):
-        img = self.resources[os.path.join("res", "imgs", "debug.png")]
+    def draw_debug_square(self, em: ecs.TilemapEcs, pos: Tuple[int, int]) -> pygame.Rect:
+        img = self.atlas.get(os.path.join("res", "imgs", "debug.png"))
         y, x = pos
         screen_pos = x * self.tile_scale, y * self.tile_scale
-        self.scr.blit(img, screen_pos)
+        return self.scr.blit(img, screen_pos)
 
 
 
-    def draw_hp_bar(self, em: ecs.TilemapEcs, entity: ecs.Entity):
+    def draw_hp_bar(self, em: ecs.TilemapEcs, entity: ecs.Entity) -> pygame.Rect:
         y, x = em.get_pos(entity)
         hc: components.HealthComponent = entity.get_component(em, components.HealthComponent)
         color = util.linint((255, 0, 0), (0, 255, 0), hc.health / hc.max_health)
         
         start_pos = x * self.tile_scale, (y + 1) * self.tile_scale
         end_pos = x * self.tile_scale, y * self.tile_scale
-        pygame.draw.line(self.scr, color, start_pos, util.linint(start_pos, end_pos, hc.health / hc.max_health), int(hc.max_health ** 0.5))
+        return pygame.draw.line(self.scr, color, start_pos, util.linint(start_pos, end_pos, hc.health / hc.max_health), int(hc.max_health ** 0.5))
 
 
-    def draw_text(self, em: ecs.TilemapEcs, pos: Tuple[int, int], comp: components.FloatingTextComponent):
+    def draw_text(self, em: ecs.TilemapEcs, pos: Tuple[int, int], comp: components.FloatingTextComponent) -> pygame.Rect:
         font: pygame.font.Font = self.resources[comp.font]
         img = font.render(comp.text, False, comp.color)
         y, x = pos
         screen_pos = self.tile_scale * x, self.tile_scale * y
-        self.scr.blit(img, screen_pos)
+        return self.scr.blit(img, screen_pos)
+
+    def draw_profiler_overlay(self, profiler: profiling.Profiler) -> pygame.Rect:
+        if self._overlay_font is None:
+            self._overlay_font = pygame.font.Font(None, 18)
+
+        font = self._overlay_font
+        rows = [("event / system", "calls", "total ms", "self ms", "max ms", "depth")]
+
+        for row in profiler.rows()[:self.profiler_overlay_rows]:
+            rows.append((f"{row['event']} / {row['system']}", str(row["calls"]), f"{row['total'] * 1000:.1f}",
+                         f"{row['self_time'] * 1000:.1f}", f"{row['max'] * 1000:.2f}", str(row["max_depth"])))
+
+        # first column left aligned, the numbers right aligned
+        imgs = [[font.render(cell, True, (255, 255, 255)) for cell in row] for row in rows]
+        column_widths = [max(row[i].get_width() for row in imgs) + 12 for i in range(len(rows[0]))]
+        line_height = font.get_linesize()
+        background = pygame.Surface((sum(column_widths) + 8, line_height * len(rows) + 8), pygame.SRCALPHA)
+        background.fill((0, 0, 0, 180))
+        rect = self.scr.blit(background, (0, 0))
+
+        for i, row in enumerate(imgs):
+            x = 4
 
-    def draw_bartext(self, em: ecs.TilemapEcs, bartext: components.BarTextComponent):
+            for j, img in enumerate(row):
+                self.scr.blit(img, (x if j == 0 else x + column_widths[j] - img.get_width() - 12, 4 + i * line_height))
+                x += column_widths[j]
+
+        return rect
+
+    def draw_bartext(self, em: ecs.TilemapEcs, bartext: components.BarTextComponent) -> pygame.Rect:
         height, width = em.tilemap.dims
         screen_pos = 0, self.tile_scale * (height)
         font: pygame.font.Font = self.resources[bartext.font]
     
         img = font.render(bartext.text, False, bartext.color)
-        self.scr.blit(img, screen_pos)
+        return self.scr.blit(img, screen_pos)
+
+    def process_batch(self, em: ecs.Ecs, events: List[ecs.Event]):
+        # only the latest frame is visible anyway
+        self.process(em, events[-1])
 
     def process(self, em: ecs.Ecs, event: ecs.Event):
         # this cound theoretically draw multiple tilemaps but this might never be necessary (maybe for chunked maps?)
         # generally the tilemap will be a singleton
-        self.scr.fill((0, 0, 0))
-
         player = None
+        pc: components.PlayerControlComponent = None
         try:
-            player = em.query_single_with_component(components.PlayerControlComponent)
-            pc: components.PlayerControlComponent = player.get_component(em, components.PlayerControlComponent)
+            player = em.view(components.PlayerControlComponent).single()
+            pc = player.get_component(em, components.PlayerControlComponent)
         except KeyError:
             pass
 
-        
         if isinstance(em, ecs.TilemapEcs):
             # then we can draw a tilemap
-            if player is not None:
-                self.draw_tilemap_with_visibility(em.tilemap, pc.visible, pc.discovered)
-            else:
-                self.draw_tilemap(em.tilemap)
+            changed = self.update_tile_layer(em.tilemap, pc)
+        elif self._tile_layer is None:
+            self._tile_layer = pygame.Surface(self.scr.get_size()).convert()
+            self._tile_layer.fill((0, 0, 0))
+            changed = None
+        else:
+            changed = []
 
+        # put the tile layer back where it changed and where last frame's sprites and text were
+        if changed is None:
+            self.scr.blit(self._tile_layer, (0, 0))
+            dirty = None
+        else:
+            dirty = changed + self._dynamic_rects
+
+            for rect in dirty:
+                self.scr.blit(self._tile_layer, rect, rect)
 
-        drawable_entities = list(em.query_all_with_components(*GraphicsSystem.SPRITE_QUERY_COMPONENTS)) # get all drawable entities
-        sorting_function = functools.partial(self._entity_sort, em)
-        drawable_entities.sort(key=sorting_function) # sort according to z index
+        drawn = []
 
-        for entity in drawable_entities:
+        for entity in self.get_draw_order(em):
             y_pos, x_pos = em.get_pos(entity)
 
-            if player is not None and pc.visible is not None and (y_pos, x_pos) not in pc.visible:
+            if player is not None and not pc.is_visible((y_pos, x_pos)):
                 continue
             
-            self.draw_entity(em, entity)
+            drawn.append(self.draw_entity(em, entity))
 
             if entity.has_component(em, components.HealthComponent):
-                self.draw_hp_bar(em, entity)
+                drawn.append(self.draw_hp_bar(em, entity))
 
-        font_entities = em.query_all_with_components(components.FloatingTextComponent)
+        font_entities = em.view(components.FloatingTextComponent)
 
         for entity in font_entities:
             comp = entity.get_component(em, components.FloatingTextComponent)
             pos = em.get_pos(entity)
-            self.draw_text(em, pos, comp)
+            drawn.append(self.draw_text(em, pos, comp))
 
 
         if player is not None and pc.autowalk_plan:
-            self.draw_path_preview(em, pc.autowalk_plan)
+            drawn.extend(self.draw_path_preview(em, pc.autowalk_plan))
+
+        if self.profiler_overlay_rows and em.profiler is not None:
+            drawn.append(self.draw_profiler_overlay(em.profiler))
 
         try:
-            bartext = em.query_single_with_component(components.BarTextComponent).get_component(em, components.BarTextComponent)
-            self.draw_bartext(em, bartext)
+            bartext = em.view(components.BarTextComponent).single().get_component(em, components.BarTextComponent)
+            drawn.append(self.draw_bartext(em, bartext))
 
         except KeyError:
-            pass
\ No newline at end of file
+            pass
+
+        self._dynamic_rects = drawn
+
+        if dirty is None or len(dirty) + len(drawn) > GraphicsSystem.MAX_DIRTY_RECTS:
+            pygame.display.update()
+        else:
+            pygame.display.update(dirty + drawn)
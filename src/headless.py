@@ -0,0 +1,169 @@
+'''
+Runs the game without a display: every gameplay system, no rendering or input, and a simulated clock. A scripted
+or AI player takes the turns as fast as the CPU allows. Useful for soak tests, throughput benchmarks and balance
+simulations on machines without a display. Nothing here may import pygame.
+
+Run from the repository root with e.g.: python -m src.headless --turns 5000 --seed 1
+'''
+from typing import *
+import argparse
+import random
+import time
+
+from . import ecs
+from . import components
+from . import tiles
+from . import events
+from . import pathfinding
+from . import physics
+from . import behaviour
+from . import player
+from . import gamestep
+from . import cleanup
+from . import nextdungeon
+
+# the player's action for the coming turn, given the game and the player entity
+PlayerPolicy = Callable[[ecs.TilemapEcs, ecs.Entity], ecs.Component]
+
+class SimulatedClock:
+    '''
+    Millisecond clock that only moves when told to, for TilemapEcs(get_ticks=...).
+    '''
+    def __init__(self, start: int = 0):
+        self.now = start
+
+    def __call__(self) -> int:
+        return self.now
+
+    def advance(self, ms: int):
+        self.now += ms
+
+class ScriptedPlayer:
+    '''
+    Plays back a fixed list of actions, then idles.
+    '''
+    def __init__(self, actions: Iterable[ecs.Component]):
+        self._actions = iter(actions)
+
+    def __call__(self, em: ecs.TilemapEcs, player_entity: ecs.Entity) -> ecs.Component:
+        return next(self._actions, player.PlayerSystem.IDLE_ACTION)
+
+class StairsSeekingPlayer:
+    '''
+    Walks the shortest way to the stairs and attacks whatever stands in the way, since walking into it is an attack.
+    '''
+    def __init__(self):
+        self._goal_map: pathfinding.DijkstraMap = None
+
+    def __call__(self, em: ecs.TilemapEcs, player_entity: ecs.Entity) -> ecs.Component:
+        graph = em.tilemap.get_grid_graph(tiles.DEFAULT_TILE_WEIGHTS)
+
+        if self._goal_map is None or self._goal_map.graph is not graph:
+            self._goal_map = pathfinding.DijkstraMap(graph)
+
+        stairs = [em.get_pos(entity) for entity in em.view(components.PickupComponent)
+                  if entity.get_component(em, components.PickupComponent).nextlevel_switch]
+        self._goal_map.update(stairs)
+        y, x = em.get_pos(player_entity)
+        next_pos = self._goal_map.next_step((y, x))
+
+        if next_pos is None:
+            return player.PlayerSystem.IDLE_ACTION
+
+        return components.MovementActionComponent(next_pos[0] - y, next_pos[1] - x)
+
+def register_gameplay_systems(em: ecs.TilemapEcs, nextdungeon_system: nextdungeon.NextDungeonSystem = None):
+    '''
+    Register every system that takes part in a turn, the same way main does but without graphics and input.
+    '''
+    em.register_system(physics.PhysicsSystem(), events.PhysicsTickEvent)
+    em.register_system(behaviour.BehaviourSystem(), events.BehaviourTickEvent)
+    em.register_system(player.PlayerSystem(), events.AfterPhysicsTickEvent)
+    em.register_system(gamestep.GamestepSystem(), events.GamestepEvent)
+    em.register_system(cleanup.CleanupDeadSystem(), events.AfterPhysicsTickEvent)
+
+    if nextdungeon_system is not None:
+        em.register_system(nextdungeon_system, events.LoadNextDungeonEvent)
+
+class HeadlessGame:
+    # simulated time that passes per turn, the same as one autowalk step
+    TURN_MS = player.PlayerSystem.AUTOWALK_FREQUENCY
+
+    def __init__(self, dims: Tuple[int, int] = (32, 32), seed: int = None, policy: PlayerPolicy = None, cache_dir: str = None):
+        # the monsters' behaviour still uses the global random module
+        random.seed(seed)
+        self.clock = SimulatedClock()
+        self.em = ecs.TilemapEcs(tiles.Tilemap(dims), self.clock)
+        components.enable_columnar_storage(self.em)
+        self.policy: PlayerPolicy = policy or StairsSeekingPlayer()
+        self.nextdungeon_system = nextdungeon.NextDungeonSystem(seed, cache_dir, pregenerate=False)
+        self.turns = 0
+        self.deaths = 0
+
+        register_gameplay_systems(self.em, self.nextdungeon_system)
+        self.em.emit_event(events.LoadNextDungeonEvent())
+
+    @property
+    def levels(self) -> int:
+        return self.nextdungeon_system.levels_loaded
+
+    def step(self):
+        '''
+        One turn of the player. If the player died, the next level is loaded instead, like pressing space in the game.
+        '''
+        players = self.em.view(components.PlayerControlComponent)
+
+        if not players:
+            self.deaths += 1
+            self.em.emit_event(events.LoadNextDungeonEvent())
+            return
+
+        player_entity = players.single()
+        self.em.add_components(player_entity, self.policy(self.em, player_entity))
+        self.em.emit_event(events.GamestepEvent())
+        self.clock.advance(HeadlessGame.TURN_MS)
+        self.turns += 1
+
+    def run(self, turns: int) -> Dict[str, float]:
+        '''
+        Play the given number of turns and report the throughput.
+        '''
+        start_turns, start_levels, start_deaths = self.turns, self.levels, self.deaths
+        start = time.perf_counter()
+
+        while self.turns - start_turns < turns:
+            self.step()
+
+        elapsed = time.perf_counter() - start
+        return {
+            "turns": self.turns - start_turns,
+            "levels": self.levels - start_levels,
+            "deaths": self.deaths - start_deaths,
+            "seconds": elapsed,
+            "turns_per_second": (self.turns - start_turns) / elapsed if elapsed else float("inf"),
+        }
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--size", type=int, default=32, help="square map size")
+    parser.add_argument("--cache-dir", default=None, help="level cache directory, see levelcache")
+    parser.add_argument("--profile", default=None, metavar="PATH", help="profile the systems and export the stats to a .json or .csv file")
+    args = parser.parse_args(argv)
+
+    game = HeadlessGame((args.size, args.size), args.seed, cache_dir=args.cache_dir)
+
+    if args.profile is not None:
+        game.em.set_profiling(True)
+
+    report = game.run(args.turns)
+
+    if args.profile is not None:
+        game.em.profiler.export(args.profile)
+
+    print(f"{report['turns']} turns, {report['levels']} levels, {report['deaths']} deaths in {report['seconds']:.2f} s "
+          f"({report['turns_per_second']:.0f} turns/s)")
+
+if __name__ == "__main__":
+    main()
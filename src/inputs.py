@@ -17,6 +17,11 @@ class UserInputSystem(ecs.System):
         match type(event):
             case events.UserInputEvent:
                 pressed_keys = event.keys
+
+                if configuration.PROFILER_TOGGLE_KEY in pressed_keys:
+                    entity_manager.set_profiling(entity_manager.profiler is None)
+                    return
+
                 # TODO: Support multiple inputs (maybe?)
                 action = configuration.KEY_MAP.get(pressed_keys[0], None)
 
@@ -0,0 +1,128 @@
+'''
+Generates and checks many levels without the game, to tune the generator and find slow or broken seeds.
+Levels are spread over a process pool and written with their stats to one binary file, see read_batch.
+
+Run from the repository root with e.g.: python -m src.levelbatch --seeds 0 1000 --sizes 32 64 -o levels.bin
+'''
+from __future__ import annotations
+
+from concurrent import futures
+from typing import *
+import argparse
+import struct
+import sys
+import time
+
+import numpy as np
+
+from . import tiles
+from . import levelgen
+
+_MAGIC = b"CELB"
+# seed, height, width, room count, corridor length, generation time, reachable fraction, size of the level that follows
+_RECORD = struct.Struct("<qHHIIddI")
+
+class LevelStats(NamedTuple):
+    seed: int
+    height: int
+    width: int
+    rooms: int
+    # floor cells outside of the rooms
+    corridor_length: int
+    generation_time: float
+    # share of the floor that can be walked to from the player's spawn
+    reachable_fraction: float
+
+def generate_with_stats(seed: int, dims: Tuple[int, int], generator_params: Dict[str, Any]) -> Tuple[LevelStats, bytes]:
+    start = time.perf_counter()
+    level = levelgen.generate_level(dims, generator_params, seed)
+    generation_time = time.perf_counter() - start
+
+    tilemap = tiles.Tilemap(dims)
+    level.apply(tilemap)
+    floor = int((~tilemap.collider_mask).sum())
+    room_area = sum((y_b - y_a + 1) * (x_b - x_a + 1) for (y_a, x_a), (y_b, x_b) in level.rooms)
+    player_pos = next(pos for pos, kind in level.spawns if kind == "player")
+    dist, _ = tilemap.get_grid_graph(tiles.DEFAULT_TILE_WEIGHTS).pathfind(player_pos)
+    reachable = int(np.isfinite(dist).sum())
+
+    stats = LevelStats(seed, *dims, len(level.rooms), floor - room_area, generation_time, reachable / floor if floor else 0.0)
+    return stats, level.to_bytes()
+
+def _generate_job(job: Tuple[int, Tuple[int, int], Dict[str, Any]]) -> Tuple[LevelStats, bytes]:
+    return generate_with_stats(*job)
+
+def write_batch(path: str, results: Iterable[Tuple[LevelStats, bytes]], on_record: Callable[[LevelStats], None] = None):
+    with open(path, "wb") as file:
+        file.write(_MAGIC)
+
+        for stats, level_bytes in results:
+            file.write(_RECORD.pack(*stats, len(level_bytes)))
+            file.write(level_bytes)
+
+            if on_record is not None:
+                on_record(stats)
+
+def read_batch(path: str) -> Iterator[Tuple[LevelStats, levelgen.LevelDescription]]:
+    with open(path, "rb") as file:
+        if file.read(len(_MAGIC)) != _MAGIC:
+            raise ValueError(f"{path} is not a level batch.")
+
+        while header := file.read(_RECORD.size):
+            *fields, size = _RECORD.unpack(header)
+            yield LevelStats(*fields), levelgen.LevelDescription.from_bytes(file.read(size))
+
+def summarize(all_stats: List[LevelStats], slowest: int = 5):
+    print(f"{'size':>9} {'levels':>7} {'rooms':>7} {'corridor':>9} {'mean ms':>9} {'max ms':>9} {'min reach':>10}")
+
+    for dims in sorted({(stats.height, stats.width) for stats in all_stats}):
+        group = [stats for stats in all_stats if (stats.height, stats.width) == dims]
+        times = [stats.generation_time * 1000 for stats in group]
+        print(f"{dims[0]:>4}x{dims[1]:<4} {len(group):>7} {np.mean([stats.rooms for stats in group]):>7.1f} "
+              f"{np.mean([stats.corridor_length for stats in group]):>9.1f} {np.mean(times):>9.2f} {max(times):>9.2f} "
+              f"{min(stats.reachable_fraction for stats in group):>10.3f}")
+
+    print("slowest:", ", ".join(f"seed {stats.seed} at {stats.height}x{stats.width} ({stats.generation_time * 1000:.1f} ms)"
+                                for stats in sorted(all_stats, key=lambda stats: -stats.generation_time)[:slowest]))
+    unreachable = [stats for stats in all_stats if stats.reachable_fraction < 1]
+
+    if unreachable:
+        print("not fully connected:", ", ".join(f"seed {stats.seed} at {stats.height}x{stats.width}" for stats in unreachable))
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seeds", type=int, nargs=2, default=[0, 100], metavar=("FIRST", "STOP"), help="range of seeds to generate")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[32], help="square map sizes")
+    parser.add_argument("-o", "--output", default="levels.bin")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes, defaults to the number of CPUs")
+    parser.add_argument("--iters", type=int, default=10000)
+    parser.add_argument("--min-room-size", type=int, default=1)
+    parser.add_argument("--max-room-size", type=int, default=7)
+    parser.add_argument("--wall-weight", type=float, default=10000)
+    parser.add_argument("--strategy", choices=[tiles.CORRIDORS_SEQUENTIAL, tiles.CORRIDORS_SPANNING_TREE], default=tiles.CORRIDORS_SEQUENTIAL)
+    parser.add_argument("--extra-loops", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    generator_params = dict(iters=args.iters, min_room_size=args.min_room_size, max_room_size=args.max_room_size,
+                            wall_weight=args.wall_weight, connection_strategy=args.strategy, extra_loops=args.extra_loops)
+    jobs = [(seed, (size, size), generator_params) for size in args.sizes for seed in range(*args.seeds)]
+    all_stats = []
+
+    def on_record(stats: LevelStats):
+        all_stats.append(stats)
+
+        if len(all_stats) % 100 == 0:
+            print(f"{len(all_stats)}/{len(jobs)} levels generated", file=sys.stderr)
+
+    start = time.perf_counter()
+
+    with futures.ProcessPoolExecutor(max_workers=args.workers) as executor:
+        write_batch(args.output, executor.map(_generate_job, jobs, chunksize=8), on_record)
+
+    print(f"wrote {len(all_stats)} levels to {args.output} in {time.perf_counter() - start:.1f} s")
+
+    if all_stats:
+        summarize(all_stats)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+'''
+On disk cache of generated levels, one file per (seed, dims, generator parameters) in LevelDescription.to_bytes form.
+Reading a level touches its file, and the least recently used files are deleted once the directory grows past max_bytes.
+The cache is best effort, a directory that can not be written to only means that nothing gets cached.
+'''
+from typing import *
+import hashlib
+import os
+
+from . import levelgen
+
+class LevelCache:
+    SUFFIX = ".level"
+
+    def __init__(self, directory: str, max_bytes: int = 32 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    @staticmethod
+    def key(seed: int, dims: Tuple[int, int], generator_params: Dict[str, Any]) -> str:
+        # the spawn counts and the file format are part of what a level looks like, too
+        description = repr((levelgen.FORMAT_VERSION, seed, tuple(dims), sorted(generator_params.items()), sorted(levelgen.SPAWN_COUNTS.items())))
+        return hashlib.sha1(description.encode()).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key + LevelCache.SUFFIX)
+
+    def get(self, seed: int, dims: Tuple[int, int], generator_params: Dict[str, Any]) -> Optional[levelgen.LevelDescription]:
+        path = self._path(LevelCache.key(seed, dims, generator_params))
+
+        try:
+            with open(path, "rb") as file:
+                level = levelgen.LevelDescription.from_bytes(file.read())
+
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+
+        return level
+
+    def put(self, level: levelgen.LevelDescription, generator_params: Dict[str, Any]) -> bool:
+        '''
+        Returns: whether the level was stored
+        '''
+        path = self._path(LevelCache.key(level.seed, level.dims, generator_params))
+        # write to a temporary file first, so other processes never read a half written level
+        temp_path = f"{path}.{os.getpid()}.tmp"
+
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+
+            with open(temp_path, "wb") as file:
+                file.write(level.to_bytes())
+
+            os.replace(temp_path, path)
+        except OSError:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+
+            return False
+
+        self.evict()
+        return True
+
+    def evict(self):
+        '''
+        Delete the least recently used levels until the cache fits into max_bytes.
+        '''
+        entries = []
+
+        try:
+            for entry in os.scandir(self.directory):
+                if entry.name.endswith(LevelCache.SUFFIX):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        except OSError:
+            return
+
+        total = sum(size for _, size, _ in entries)
+
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+
+            total -= size
+
+    def get_or_generate(self, seed: int, dims: Tuple[int, int], generator_params: Dict[str, Any]) -> levelgen.LevelDescription:
+        level = self.get(seed, dims, generator_params)
+
+        if level is None:
+            level = levelgen.generate_level(dims, generator_params, seed)
+            self.put(level, generator_params)
+
+        return level
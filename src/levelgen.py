@@ -0,0 +1,113 @@
+'''
+Level generation that does not need the running game. generate_level builds the tiles and picks the spawn points,
+and hands everything back as a small picklable LevelDescription, so levels can be generated in a worker process
+while the current one is being played. Nothing here may import pygame.
+
+Levels are fully determined by (seed, dims, generator parameters), which makes them cacheable, see levelcache.
+'''
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import *
+import random
+import struct
+import zlib
+
+import numpy as np
+
+from . import tiles
+
+# kinds of entities to spawn besides the player and the stairs, and the (inclusive) range of how many of them
+SPAWN_COUNTS: Dict[str, Tuple[int, int]] = {
+    "rat": (0, 20),
+    "goblin": (1, 10),
+    "water": (1, 10),
+}
+
+# magic, format version, height, width, seed, then the number of rooms, connections and spawns and the size of the kind names
+_HEADER = struct.Struct("<4sHHHqIIII")
+_MAGIC = b"CELV"
+FORMAT_VERSION = 1
+
+def random_seed(rng: random.Random = random) -> int:
+    return rng.randrange(1 << 63)
+
+@dataclass
+class LevelDescription:
+    dims: Tuple[int, int]
+    # raw uint8 tile values in row major order
+    cells: bytes
+    seed: int = 0
+    rooms: List[Tuple[Tuple[int, int], Tuple[int, int]]] = field(default_factory=list)
+    room_connections: List[Tuple[int, int]] = field(default_factory=list)
+    # (position, kind) where kind names a function in entity_definitions
+    spawns: List[Tuple[Tuple[int, int], str]] = field(default_factory=list)
+
+    def get_cells(self) -> np.ndarray:
+        return np.frombuffer(self.cells, dtype=np.uint8).reshape(self.dims)
+
+    def apply(self, tilemap: tiles.Tilemap):
+        tilemap.set_cells(self.get_cells(), self.rooms, self.room_connections)
+
+    def to_bytes(self) -> bytes:
+        '''
+        Compact binary form: a fixed header followed by the zlib compressed tiles, rooms, connections and spawns.
+        '''
+        kinds = sorted({kind for _, kind in self.spawns})
+        kind_names = "\n".join(kinds).encode()
+        body = b"".join((
+            self.cells,
+            np.array(self.rooms, dtype=np.int32).reshape(-1, 4).tobytes(),
+            np.array(self.room_connections, dtype=np.int32).reshape(-1, 2).tobytes(),
+            np.array([pos for pos, _ in self.spawns], dtype=np.int32).reshape(-1, 2).tobytes(),
+            np.array([kinds.index(kind) for _, kind in self.spawns], dtype=np.uint8).tobytes(),
+            kind_names,
+        ))
+        header = _HEADER.pack(_MAGIC, FORMAT_VERSION, *self.dims, self.seed, len(self.rooms), len(self.room_connections), len(self.spawns), len(kind_names))
+        return header + zlib.compress(body)
+
+    @staticmethod
+    def from_bytes(data: bytes) -> LevelDescription:
+        magic, version, height, width, seed, room_count, connection_count, spawn_count, names_size = _HEADER.unpack_from(data)
+
+        if magic != _MAGIC or version != FORMAT_VERSION:
+            raise ValueError("Not a level of the current format.")
+
+        body = zlib.decompress(data[_HEADER.size:])
+        offset = 0
+
+        def take(dtype: Any, shape: Tuple[int, ...]) -> np.ndarray:
+            nonlocal offset
+            count = int(np.prod(shape))
+            array = np.frombuffer(body, dtype=dtype, count=count, offset=offset).reshape(shape)
+            offset += count * np.dtype(dtype).itemsize
+            return array
+
+        cells = take(np.uint8, (height * width,)).tobytes()
+        rooms = [((y_a, x_a), (y_b, x_b)) for y_a, x_a, y_b, x_b in take(np.int32, (room_count, 4)).tolist()]
+        connections = [(a, b) for a, b in take(np.int32, (connection_count, 2)).tolist()]
+        positions = [(y, x) for y, x in take(np.int32, (spawn_count, 2)).tolist()]
+        kind_indices = take(np.uint8, (spawn_count,)).tolist()
+        kinds = body[offset:offset + names_size].decode().split("\n")
+        spawns = [(pos, kinds[index]) for pos, index in zip(positions, kind_indices)]
+        return LevelDescription((height, width), cells, seed, rooms, connections, spawns)
+
+def generate_level(dims: Tuple[int, int], generator_params: Dict[str, Any], seed: int = None, verbose: bool = False) -> LevelDescription:
+    '''
+    Generate a level with Tilemap.generate_random_connected_rooms(**generator_params). The same seed always gives
+    the same level, without a seed a random one is picked and stored in the description.
+    '''
+    if seed is None:
+        seed = random_seed()
+
+    rng = random.Random(seed)
+    tilemap = tiles.Tilemap(dims)
+    tilemap.generate_random_connected_rooms(verbose=verbose, rng=rng, **generator_params)
+    spawns = [(tilemap.get_random_empty_tile(rng), "player")]
+
+    for kind, (low, high) in SPAWN_COUNTS.items():
+        for _ in range(rng.randint(low, high)):
+            spawns.append((tilemap.get_random_empty_tile(rng), kind))
+
+    spawns.append((tilemap.get_random_empty_tile(rng), "stairs"))
+    return LevelDescription(tuple(dims), tilemap.cells.tobytes(), seed, list(tilemap.rooms), list(tilemap.room_connections), spawns)
@@ -0,0 +1,132 @@
+'''
+Point to point line of sight queries with precomputed Bresenham tables and a result cache.
+'''
+from __future__ import annotations
+
+import functools
+import itertools
+from typing import *
+
+import numpy as np
+
+from . import util
+
+@functools.lru_cache(maxsize=None)
+def bresenham_table(max_range: int, width: int) -> Dict[Tuple[int, int], Tuple[int, ...]]:
+    '''
+    For every (dy, dx) up to max_range away, the flat offsets (dy * width + dx) of the cells that util.iterate_line
+    passes through before reaching the target. The lines only depend on the difference between the endpoints,
+    so one table serves every origin on maps of that width.
+    '''
+    table = {}
+
+    for dy in range(-max_range, max_range + 1):
+        for dx in range(-max_range, max_range + 1):
+            line = list(util.iterate_line((0, 0), (dy, dx)))[:-1]
+            table[dy, dx] = tuple(y * width + x for y, x in line)
+
+    return table
+
+@functools.lru_cache(maxsize=None)
+def bresenham_arrays(max_range: int, width: int) -> Tuple[np.ndarray, np.ndarray]:
+    '''
+    bresenham_table as arrays indexed by [dy + max_range, dx + max_range], for answering many queries at once.
+    The lines are padded to the longest one, valid marks the offsets that are actually on a line.
+
+    Returns: (offsets, valid), both of shape (2 * max_range + 1, 2 * max_range + 1, longest line)
+    '''
+    table = bresenham_table(max_range, width)
+    side = 2 * max_range + 1
+    longest = max(map(len, table.values()))
+    offsets = np.zeros((side, side, longest), dtype=np.int64)
+    valid = np.zeros((side, side, longest), dtype=bool)
+
+    for (dy, dx), line in table.items():
+        offsets[dy + max_range, dx + max_range, :len(line)] = line
+        valid[dy + max_range, dx + max_range, :len(line)] = True
+
+    return offsets, valid
+
+class LineOfSight:
+    '''
+    Line of sight service for one tilemap. Results are cached per (origin, target) and the cache is dropped whenever
+    the tilemap version changes. Queries further apart than max_range fall back to walking the line.
+    '''
+    MAX_CACHE_SIZE = 1 << 16
+
+    def __init__(self, tilemap, max_range: int = 16):
+        self.tilemap = tilemap
+        self.max_range = max_range
+        self._table = bresenham_table(max_range, tilemap.dims[1])
+        self._cache: Dict[Tuple[Tuple[int, int], Tuple[int, int]], bool] = {}
+        self._blockers: List[bool] = []
+        self._version = None
+
+    def _sync(self):
+        if self._version != self.tilemap.version:
+            self._cache.clear()
+            self._blockers = self.tilemap.los_blocker_mask.ravel().tolist()
+            self._version = self.tilemap.version
+
+    def in_los(self, origin: Tuple[int, int], target: Tuple[int, int]) -> bool:
+        '''
+        Returns true if target can be seen from origin.
+        '''
+        self._sync()
+        key = origin, target
+        result = self._cache.get(key)
+
+        if result is not None:
+            return result
+
+        origin_y, origin_x = origin
+        target_y, target_x = target
+        offsets = self._table.get((target_y - origin_y, target_x - origin_x))
+        blockers = self._blockers
+        result = True
+
+        if offsets is not None:
+            base = origin_y * self.tilemap.dims[1] + origin_x
+
+            for offset in offsets:
+                if blockers[base + offset]:
+                    result = False
+                    break
+        else:
+            blocker_mask = self.tilemap.los_blocker_mask
+
+            for pos in list(util.iterate_line(origin, target))[:-1]:
+                if blocker_mask[pos]:
+                    result = False
+                    break
+
+        if len(self._cache) >= LineOfSight.MAX_CACHE_SIZE:
+            self._cache.clear()
+
+        self._cache[key] = result
+        return result
+
+    def in_los_many(self, origins: Iterable[Tuple[int, int]], target: Tuple[int, int]) -> List[bool]:
+        '''
+        Batch form of in_los for many origins looking at one target, e.g. every NPC checking whether it can see the player.
+        All origins within max_range are answered together by indexing the blockers with the padded table.
+        '''
+        origins = np.fromiter(itertools.chain.from_iterable(origins), dtype=np.int64).reshape(-1, 2)
+        result = np.ones(len(origins), dtype=bool)
+        max_range = self.max_range
+        width = self.tilemap.dims[1]
+        delta = np.asarray(target, dtype=np.int64) - origins
+        near = (np.abs(delta) <= max_range).all(axis=1)
+
+        if near.any():
+            offsets, valid = bresenham_arrays(max_range, width)
+            rows, columns = (delta[near] + max_range).T
+            line_offsets, line_valid = offsets[rows, columns], valid[rows, columns]
+            bases = origins[near] @ (width, 1)
+            blockers = self.tilemap.los_blocker_mask.ravel()
+            result[near] = ~(blockers[bases[:, None] + line_offsets] & line_valid).any(axis=1)
+
+        for i in np.flatnonzero(~near).tolist():
+            result[i] = self.in_los(tuple(origins[i].tolist()), target)
+
+        return result.tolist()
@@ -22,21 +22,25 @@ from . import nextdungeon
 def main():
     # ECS initialization
     pygame.init()
-    game = ecs.TilemapEcs(tiles.Tilemap(configuration.DUNGEON_DIMS))
+    game = ecs.TilemapEcs(tiles.Tilemap(configuration.DUNGEON_DIMS), pygame.time.get_ticks)
+
+    components.enable_columnar_storage(game)
+
     clock = pygame.time.Clock()
     
     # Load resources
     res = resources.load_res(configuration.RESOURCES_PATH, tile_scale=configuration.SCALE)
 
     # System initialization
-    graphics_system = graphics.GraphicsSystem(res, tile_scale=configuration.SCALE, window_dimensions=configuration.WINDOW_DIMS)
+    graphics_system = graphics.GraphicsSystem(res, tile_scale=configuration.SCALE, window_dimensions=configuration.WINDOW_DIMS, profiler_overlay_rows=configuration.PROFILER_OVERLAY_ROWS)
     user_input_system = inputs.UserInputSystem()
     physics_system = physics.PhysicsSystem()
     behaviour_system = behaviour.BehaviourSystem()
     player_system = player.PlayerSystem()
     gamestep_system = gamestep.GamestepSystem()
     cleanup_system = cleanup.CleanupDeadSystem()
-    nextdungeon_system = nextdungeon.NextDungeonSystem()
+    generator_params = dict(nextdungeon.NextDungeonSystem.GENERATOR_PARAMS, connection_strategy=configuration.CORRIDOR_STRATEGY, extra_loops=configuration.CORRIDOR_EXTRA_LOOPS)
+    nextdungeon_system = nextdungeon.NextDungeonSystem(configuration.LEVEL_SEED, configuration.LEVEL_CACHE_PATH, configuration.LEVEL_CACHE_MAX_BYTES, generator_params=generator_params)
 
     game.register_system(graphics_system, events.RenderTickEvent)
     game.register_system(user_input_system, events.UserInputEvent, events.RenderTickEvent)
@@ -47,31 +51,31 @@ def main():
     game.register_system(cleanup_system, events.AfterPhysicsTickEvent)
     game.register_system(nextdungeon_system, events.LoadNextDungeonEvent)
 
+    game.set_queued_dispatch(configuration.QUEUED_DISPATCH, configuration.EVENT_COALESCING)
+
     # Initialise game
     game.emit_event(events.LoadNextDungeonEvent())
 
-    while True:
-        pressed_keys = []
+    try:
+        while True:
+            pressed_keys = []
 
-        for pygame_event in pygame.event.get():
-            if pygame_event.type == pygame.QUIT: 
-                return
+            for pygame_event in pygame.event.get():
+                if pygame_event.type == pygame.QUIT: 
+                    return
 
-            if pygame_event.type == pygame.KEYDOWN:
-                pressed_keys.append(pygame_event.key)
+                if pygame_event.type == pygame.KEYDOWN:
+                    pressed_keys.append(pygame_event.key)
 
-        if pressed_keys:
-            game.emit_event(events.UserInputEvent(pressed_keys))
+            if pressed_keys:
+                game.emit_event(events.UserInputEvent(pressed_keys))
 
-        pygame.display.flip()
-        dt = clock.tick(configuration.TARGET_FPS)
-        game.emit_event(events.RenderTickEvent(dt, util.reverse_tuple(pygame.mouse.get_pos()), pygame.mouse.get_pressed()[0]))
- 
-main() #cmmit this line to run the game with menu
-        
-# uncommit this line to run the game with menu    
-# def run_game():
-#     main()  
+            dt = clock.tick(configuration.TARGET_FPS)
+            game.emit_event(events.RenderTickEvent(dt, util.reverse_tuple(pygame.mouse.get_pos()), pygame.mouse.get_pressed()[0]))
+            game.drain_events()
+    finally:
+        nextdungeon_system.shutdown()
 
-# if __name__ == "__main__":
-#     run_game()  
+# main() is not called on import anymore, run_game.py calls it (or pass it to menu.main_menu to start from the menu)
+if __name__ == "__main__":
+    main()
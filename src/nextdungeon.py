@@ -1,4 +1,8 @@
 from typing import *
+from concurrent import futures
+from concurrent.futures.process import BrokenProcessPool
+import multiprocessing
+import random
 
 from . import ecs
 from . import components
@@ -6,22 +10,106 @@ from . import tiles
 from . import events
 from . import util
 from . import entity_definitions
-import random
+from . import levelgen
+from . import levelcache
 
 class NextDungeonSystem(ecs.System):
-    def __init__(self):
-        pass
+    '''
+    Loads the next level. The level after that is generated ahead of time in a worker process, so taking the stairs
+    only swaps in a finished level. If it is not done yet, the rest of it is waited for, since the worker had a head start
+    over generating the level right here. Without a worker the level is generated here.
+    '''
+    # arguments of Tilemap.generate_random_connected_rooms, the corridors are carved with its default strategy
+    GENERATOR_PARAMS = dict(iters=10000, max_room_size=7)
+    SPAWNERS: Dict[str, Callable[[], Iterable[ecs.Component]]] = {
+        "player": entity_definitions.player,
+        "rat": entity_definitions.rat,
+        "goblin": entity_definitions.goblin,
+        "water": entity_definitions.water,
+        "stairs": entity_definitions.stairs,
+    }
+
+    def __init__(self, seed: int = None, cache_dir: str = None, cache_max_bytes: int = 32 * 1024 * 1024, pregenerate=True, generator_params: Dict[str, Any] = None):
+        '''
+        The seeds of all levels are drawn in order from a generator seeded with seed, so a seed gives the same run of levels.
+        With cache_dir and a seed, generated levels are stored on disk and loaded from there the next time. Without a
+        seed every run gets new levels, which would never be read back.
+        generator_params replaces GENERATOR_PARAMS, e.g. to pick another corridor strategy.
+        '''
+        self.pregenerate = pregenerate
+        self.generator_params: Dict[str, Any] = NextDungeonSystem.GENERATOR_PARAMS if generator_params is None else generator_params
+        self.cache = levelcache.LevelCache(cache_dir, cache_max_bytes) if cache_dir is not None and seed is not None else None
+        self._seeds = random.Random(seed)
+        self._next_seed = levelgen.random_seed(self._seeds)
+        self._executor: futures.ProcessPoolExecutor = None
+        self._pending: Tuple[int, futures.Future] = None
+        self.levels_loaded = 0
+
+    def _generate(self, dims: Tuple[int, int], seed: int) -> levelgen.LevelDescription:
+        if self.cache is not None:
+            return self.cache.get_or_generate(seed, dims, self.generator_params)
+
+        return levelgen.generate_level(dims, self.generator_params, seed)
+
+    def _take_pregenerated(self, dims: Tuple[int, int], seed: int) -> Optional[levelgen.LevelDescription]:
+        if self._pending is None:
+            return None
+
+        (pending_seed, pending), self._pending = self._pending, None
+
+        if pending_seed != seed:
+            # nobody will ask for that level anymore, don't let it hold up the worker
+            pending.cancel()
+            return None
+
+        try:
+            level = pending.result()
+        except BrokenProcessPool:
+            self.pregenerate = False
+            return None
+        except Exception:
+            # whatever went wrong in the worker, the level can still be generated here
+            return None
+
+        return level if level.dims == tuple(dims) else None
+
+    def _pregenerate(self, dims: Tuple[int, int], seed: int):
+        if not self.pregenerate or self._pending is not None:
+            return
+
+        try:
+            if self._executor is None:
+                # spawn instead of fork, the game process has SDL threads running
+                self._executor = futures.ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn"))
+
+            if self.cache is not None:
+                future = self._executor.submit(self.cache.get_or_generate, seed, tuple(dims), self.generator_params)
+            else:
+                future = self._executor.submit(levelgen.generate_level, tuple(dims), self.generator_params, seed)
+
+            self._pending = seed, future
+        except (OSError, BrokenProcessPool):
+            self.pregenerate = False
+
+    def shutdown(self):
+        '''
+        Stop the worker process. Call before the game exits.
+        '''
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+            self._pending = None
 
     def process(self, em: ecs.TilemapEcs, event: events.LoadNextDungeonEvent):
         entities = []
 
         try:
-            level_number: components.BarTextComponent = em.query_single_with_component(components.BarTextComponent).get_component(em, components.BarTextComponent)
+            level_number: components.BarTextComponent = em.view(components.BarTextComponent).single().get_component(em, components.BarTextComponent)
             level_label, number = level_number.text.split()
             next_text = f"{level_label} {int(number) + 1}"
         except (KeyError, ValueError):
             next_text = "Level 1"
-            
+
 
         for entity in em.entities:
             entities.append(entity)
@@ -29,19 +117,18 @@ class NextDungeonSystem(ecs.System):
         for entity in entities:
             em.remove_entity(entity)
 
-        em.tilemap.generate_random_connected_rooms(iters=10000, max_room_size=7)
-    
-        em.create_entity(em.tilemap.get_random_empty_tile(), *entity_definitions.player())
+        seed, self._next_seed = self._next_seed, levelgen.random_seed(self._seeds)
+        level = self._take_pregenerated(em.tilemap.dims, seed)
+
+        if level is None:
+            level = self._generate(em.tilemap.dims, seed)
 
-        for _ in range(random.randint(0, 20)):
-            em.create_entity(em.tilemap.get_random_empty_tile(), *entity_definitions.rat())
+        level.apply(em.tilemap)
+        self.levels_loaded += 1
+        self._pregenerate(em.tilemap.dims, self._next_seed)
 
-        for _ in range(random.randint(1, 10)):
-            em.create_entity(em.tilemap.get_random_empty_tile(), *entity_definitions.goblin())
+        for pos, kind in level.spawns:
+            em.create_entity(pos, *NextDungeonSystem.SPAWNERS[kind]())
 
-        for _ in range(random.randint(1, 10)):
-            em.create_entity(em.tilemap.get_random_empty_tile(), *entity_definitions.water())
-    
-        em.create_entity(em.tilemap.get_random_empty_tile(), *entity_definitions.stairs())
         em.create_entity((0, 0), *entity_definitions.bar_text(next_text))
         em.emit_event(events.GamestepEvent())
@@ -0,0 +1,809 @@
+'''
+Pathfinding that works directly on a 2d cost grid instead of a util.Graph. Cells are addressed by their flat
+index y * width + x, and the search buffers are allocated once per GridGraph and reused for every search.
+'''
+from __future__ import annotations
+
+import heapq
+from typing import *
+
+import numpy as np
+
+from . import util
+
+EIGHT_DELTAS = frozenset((dy, dx) for dy in (-1, 0, 1) for dx in (-1, 0, 1) if dy or dx)
+
+def _no_heuristic(a, b) -> float:
+    return 0
+
+def _sign(x: int) -> int:
+    return (x > 0) - (x < 0)
+
+def _flat_view(passable: Optional[np.ndarray]) -> Optional[memoryview]:
+    '''
+    Flat view of a boolean grid that is indexed by flat cell index. Nothing is copied for contiguous grids,
+    so searches do not pay for the size of the map and always see the grid's current contents.
+    '''
+    if passable is None:
+        return None
+
+    return np.ascontiguousarray(passable, dtype=bool).reshape(-1).data
+
+class GridGraph:
+    '''
+    Implicit graph over a grid. Entering a cell costs the cell's entry in cost_grid times the cost of the delta
+    used to get there, the same way util.Graph.from_2dgrid weighs its edges. Cells with infinite cost can not be entered.
+    '''
+    def __init__(self, cost_grid: np.ndarray, deltas_cost: Union[Dict[Tuple[int, int], float], Iterable[Tuple[int, int]]] = ((1,0), (0,1), (-1,0), (0,-1))):
+        self.dims: Tuple[int, int] = cost_grid.shape
+        self.height, self.width = self.dims
+
+        if not isinstance(deltas_cost, dict):
+            deltas_cost = {delta: 1 for delta in deltas_cost}
+
+        self.deltas_cost: Dict[Tuple[int, int], float] = dict(deltas_cost)
+        self._neighbours = [(dy, dx, dy * self.width + dx, cost) for (dy, dx), cost in self.deltas_cost.items()]
+        self._cost: List[float] = []
+        # bumped whenever costs change, so users of the graph can tell that cached results are stale
+        self.version = 0
+        self.set_cost_grid(cost_grid)
+
+        size = self.height * self.width
+        self._unreached = [float("inf")] * size
+        self._no_prev = [-1] * size
+        self._dist: List[float] = list(self._unreached)
+        self._prev: List[int] = list(self._no_prev)
+        # cells whose _dist and _prev entries the last search wrote, only these are reset for the next one
+        self._touched: List[int] = []
+        # a cell is closed in the running search if its entry equals _search_id, which saves clearing it per search
+        self._closed: List[int] = [0] * size
+        self._search_id = 0
+        # number of nodes expanded by the last search, for benchmarking
+        self.last_expansions = 0
+        self._uniform: Tuple[int, bool] = None
+
+    def set_cost_grid(self, cost_grid: np.ndarray):
+        if cost_grid.shape != self.dims:
+            raise ValueError(f"Cost grid of shape {cost_grid.shape} does not fit a graph of shape {self.dims}.")
+
+        self._cost = cost_grid.astype(np.float64).ravel().tolist()
+        self.version += 1
+
+    def update_costs(self, indices: Iterable[int], costs: Iterable[float]):
+        '''
+        Change the cost of entering the given flat cell indices. Only the edges into these cells are affected,
+        so this is all that is needed when a few tiles change.
+        '''
+        cost = self._cost
+
+        for index, new_cost in zip(indices, costs):
+            cost[index] = float(new_cost)
+
+        self.version += 1
+
+    def _begin_search(self) -> int:
+        '''
+        Reset the search buffers where the previous search wrote to them.
+
+        Returns: the id that marks cells as closed in the new search
+        '''
+        dist, prev = self._dist, self._prev
+        inf = float("inf")
+
+        for index in self._touched:
+            dist[index] = inf
+            prev[index] = -1
+
+        self._touched = []
+        self._search_id += 1
+        return self._search_id
+
+    def index(self, pos: Tuple[int, int]) -> int:
+        y, x = pos
+        return y * self.width + x
+
+    def position(self, index: int) -> Tuple[int, int]:
+        return divmod(index, self.width)
+
+    def pathfind(self, origin: Tuple[int, int], dest: Tuple[int, int] = None, heuristic: Callable = _no_heuristic, passable: np.ndarray = None) -> Tuple[List[float], List[int]]:
+        '''
+        A* search with the same contract as util.Graph.pathfind. Early exit if dest is set. Faster if a suitable heuristic is given.
+        passable is an optional boolean grid, cells that are False there are never entered.
+
+        Returns: (flat distance buffer, flat previous index buffer). Both are reused by the next search on this graph,
+        so read them (or trace_path them) before searching again.
+        '''
+        height, width = self.dims
+        cost = self._cost
+        neighbours = self._neighbours
+        search_id = self._begin_search()
+        dist = self._dist
+        prev = self._prev
+        touched = self._touched
+        passable_flat = _flat_view(passable)
+        closed = self._closed
+
+        if dest is None:
+            heuristic = _no_heuristic
+            goal = -1
+        else:
+            goal = self.index(dest)
+
+        start = self.index(origin)
+        dist[start] = 0
+        touched.append(start)
+        pq = [(heuristic(origin, dest), start)]
+        expansions = 0
+
+        while pq:
+            _, curr = heapq.heappop(pq)
+
+            if closed[curr] == search_id:
+                continue
+
+            closed[curr] = search_id
+            expansions += 1
+
+            if curr == goal:
+                break
+
+            y, x = divmod(curr, width)
+            curr_dist = dist[curr]
+
+            for dy, dx, offset, delta_cost in neighbours:
+                ny, nx = y + dy, x + dx
+
+                if not (0 <= ny < height and 0 <= nx < width):
+                    continue
+
+                child = curr + offset
+
+                if passable_flat is not None and not passable_flat[child]:
+                    continue
+
+                alt = curr_dist + cost[child] * delta_cost
+
+                if alt < dist[child]:
+                    dist[child] = alt
+                    prev[child] = curr
+                    touched.append(child)
+                    heapq.heappush(pq, (alt + heuristic((ny, nx), dest), child))
+
+        self.last_expansions = expansions
+        return dist, prev
+
+    def pathfind_multi_source(self, origins: Sequence[Tuple[int, int]]) -> Tuple[List[float], List[int], List[int]]:
+        '''
+        One Dijkstra search from all origins at once. Every cell ends up owned by the origin it is cheapest to reach
+        from, which splits the grid into cost weighted Voronoi regions. The prev chain of a cell leads back to its owner.
+
+        Returns: (flat distance buffer, flat previous index buffer, flat owner buffer of indices into origins).
+        The first two are reused by the next search on this graph, like with pathfind.
+        '''
+        height, width = self.dims
+        cost = self._cost
+        neighbours = self._neighbours
+        self._begin_search()
+        dist = self._dist
+        prev = self._prev
+        touched = self._touched
+        owner = list(self._no_prev)
+        pq = []
+
+        for i, origin in enumerate(origins):
+            start = self.index(origin)
+
+            if dist[start] > 0:
+                dist[start] = 0
+                owner[start] = i
+                touched.append(start)
+                pq.append((0, start))
+
+        heapq.heapify(pq)
+        expansions = 0
+
+        while pq:
+            curr_dist, curr = heapq.heappop(pq)
+
+            if curr_dist > dist[curr]:
+                continue
+
+            expansions += 1
+            y, x = divmod(curr, width)
+            curr_owner = owner[curr]
+
+            for dy, dx, offset, delta_cost in neighbours:
+                ny, nx = y + dy, x + dx
+
+                if not (0 <= ny < height and 0 <= nx < width):
+                    continue
+
+                child = curr + offset
+                alt = curr_dist + cost[child] * delta_cost
+
+                if alt < dist[child]:
+                    dist[child] = alt
+                    prev[child] = curr
+                    owner[child] = curr_owner
+                    touched.append(child)
+                    heapq.heappush(pq, (alt, child))
+
+        self.last_expansions = expansions
+        return dist, prev, owner
+
+    def supports_jump_point_search(self) -> bool:
+        '''
+        Jump point search needs 8-connected movement with one cost for all cardinal and one for all diagonal
+        moves, and every enterable cell has to cost the same.
+        '''
+        if self._uniform is None or self._uniform[0] != self.version:
+            cardinal_costs = {cost for (dy, dx), cost in self.deltas_cost.items() if not (dy and dx)}
+            diagonal_costs = {cost for (dy, dx), cost in self.deltas_cost.items() if dy and dx}
+            cell_costs = set(self._cost)
+            cell_costs.discard(float("inf"))
+            uniform = self.deltas_cost.keys() == EIGHT_DELTAS and len(cardinal_costs) == len(diagonal_costs) == 1 and len(cell_costs) <= 1
+            self._uniform = self.version, uniform
+
+        return self._uniform[1]
+
+    def pathfind_jps(self, origin: Tuple[int, int], dest: Tuple[int, int], heuristic: Callable = _no_heuristic, passable: np.ndarray = None) -> Tuple[List[float], List[int]]:
+        '''
+        Jump point search, a drop in replacement for pathfind on graphs where supports_jump_point_search is true.
+        It skips over the many symmetric paths through open rooms that plain A* expands. Diagonal moves may cut
+        corners, just like in pathfind.
+
+        Returns: the same buffers as pathfind. prev links jump points that can be several cells apart,
+        trace_path fills in the cells between them.
+        '''
+        if not self.supports_jump_point_search():
+            raise ValueError("Jump point search needs uniform cell costs and 8-connected movement.")
+
+        height, width = self.dims
+        cost = self._cost
+        inf = float("inf")
+        cardinal_cost = self.deltas_cost[(0, 1)]
+        diagonal_cost = self.deltas_cost[(1, 1)]
+        search_id = self._begin_search()
+        dist = self._dist
+        prev = self._prev
+        touched = self._touched
+        passable_flat = _flat_view(passable)
+        closed = self._closed
+        goal_y, goal_x = dest
+
+        def walkable(y: int, x: int) -> bool:
+            if not (0 <= y < height and 0 <= x < width):
+                return False
+
+            index = y * width + x
+            return cost[index] != inf and (passable_flat is None or passable_flat[index])
+
+        def jump(y: int, x: int, dy: int, dx: int) -> Optional[Tuple[int, int]]:
+            while True:
+                y, x = y + dy, x + dx
+
+                if not walkable(y, x):
+                    return None
+
+                if y == goal_y and x == goal_x:
+                    return y, x
+
+                if dy and dx:
+                    if (not walkable(y - dy, x) and walkable(y - dy, x + dx)) or (not walkable(y, x - dx) and walkable(y + dy, x - dx)):
+                        return y, x
+
+                    if jump(y, x, dy, 0) is not None or jump(y, x, 0, dx) is not None:
+                        return y, x
+                elif dx:
+                    if (not walkable(y + 1, x) and walkable(y + 1, x + dx)) or (not walkable(y - 1, x) and walkable(y - 1, x + dx)):
+                        return y, x
+                else:
+                    if (not walkable(y, x + 1) and walkable(y + dy, x + 1)) or (not walkable(y, x - 1) and walkable(y + dy, x - 1)):
+                        return y, x
+
+        def directions(y: int, x: int, parent: int) -> Iterable[Tuple[int, int]]:
+            if parent == -1:
+                return EIGHT_DELTAS
+
+            parent_y, parent_x = divmod(parent, width)
+            dy, dx = _sign(y - parent_y), _sign(x - parent_x)
+
+            if dy and dx:
+                result = [(dy, 0), (0, dx), (dy, dx)]
+
+                if not walkable(y - dy, x):
+                    result.append((-dy, dx))
+
+                if not walkable(y, x - dx):
+                    result.append((dy, -dx))
+            elif dx:
+                result = [(0, dx)]
+
+                if not walkable(y + 1, x):
+                    result.append((1, dx))
+
+                if not walkable(y - 1, x):
+                    result.append((-1, dx))
+            else:
+                result = [(dy, 0)]
+
+                if not walkable(y, x + 1):
+                    result.append((dy, 1))
+
+                if not walkable(y, x - 1):
+                    result.append((dy, -1))
+
+            return result
+
+        goal = self.index(dest)
+        start = self.index(origin)
+        dist[start] = 0
+        touched.append(start)
+        pq = [(heuristic(origin, dest), start)]
+        expansions = 0
+
+        while pq:
+            _, curr = heapq.heappop(pq)
+
+            if closed[curr] == search_id:
+                continue
+
+            closed[curr] = search_id
+            expansions += 1
+
+            if curr == goal:
+                break
+
+            y, x = divmod(curr, width)
+            curr_dist = dist[curr]
+
+            for dy, dx in directions(y, x, prev[curr]):
+                jump_point = jump(y, x, dy, dx)
+
+                if jump_point is None:
+                    continue
+
+                jump_y, jump_x = jump_point
+                child = jump_y * width + jump_x
+                steps = max(abs(jump_y - y), abs(jump_x - x))
+                alt = curr_dist + cost[child] * steps * (diagonal_cost if dy and dx else cardinal_cost)
+
+                if alt < dist[child]:
+                    dist[child] = alt
+                    prev[child] = curr
+                    touched.append(child)
+                    heapq.heappush(pq, (alt + heuristic(jump_point, dest), child))
+
+        self.last_expansions = expansions
+        return dist, prev
+
+    def trace_path(self, prev: List[int], dest: Tuple[int, int]) -> List[Tuple[int, int]]:
+        '''
+        After pathfinding, this can convert the returned prev buffer and a destination into an actual path, i.e. a list of positions.
+        Like util.Graph.trace_path, an unreachable destination results in [dest].
+        '''
+        curr = self.index(dest)
+        y, x = dest
+        path = [dest]
+
+        while prev[curr] != -1:
+            curr = prev[curr]
+            prev_y, prev_x = divmod(curr, self.width)
+            dy, dx = _sign(prev_y - y), _sign(prev_x - x)
+
+            # jump point search links cells along straight or diagonal lines, walk them one step at a time
+            while (y, x) != (prev_y, prev_x):
+                y, x = y + dy, x + dx
+                path.append((y, x))
+
+        path.reverse()
+        return path
+
+    def get_distance(self, dist: List[float], pos: Tuple[int, int]) -> float:
+        return dist[self.index(pos)]
+
+class DijkstraMap:
+    '''
+    Distance field ("Dijkstra map") from a set of goals to every cell of a GridGraph. It is only rebuilt when the
+    goals or the graph change, after that any number of entities can read their next step toward the goals in O(1).
+    Negating and rescanning the field gives a flee map that leads away from the goals and out of dead ends.
+    With a max_distance the scan stops there, cells further from the goals are left unreached.
+    '''
+    FLEE_COEFFICIENT = -1.2
+
+    def __init__(self, graph: GridGraph, max_distance: float = float("inf")):
+        self.graph = graph
+        self.max_distance = max_distance
+        self.goals: Dict[Tuple[int, int], float] = {}
+        self.distances: List[float] = []
+        self._version = None
+        self._flee_map: DijkstraMap = None
+
+    def update(self, goals: Union[Iterable[Tuple[int, int]], Dict[Tuple[int, int], float]]) -> bool:
+        '''
+        Set the goals of the map. goals can also be a dict mapping goals to their starting value, lower values are more attractive.
+
+        Returns: whether the field had to be recomputed
+        '''
+        if not isinstance(goals, dict):
+            goals = {goal: 0 for goal in goals}
+
+        if goals == self.goals and self._version == self.graph.version:
+            return False
+
+        self.goals = dict(goals)
+        self.distances = self._scan({self.graph.index(goal): value for goal, value in goals.items()})
+        self._version = self.graph.version
+        self._flee_map = None
+        return True
+
+    def _scan(self, sources: Dict[int, float]) -> List[float]:
+        '''
+        Multi source Dijkstra that computes the cost of getting from every cell to the cheapest source.
+        '''
+        graph = self.graph
+        height, width = graph.dims
+        cost = graph._cost
+        inf = float("inf")
+        max_distance = self.max_distance
+        dist = list(graph._unreached)
+        pq = []
+
+        for index, value in sources.items():
+            if value < dist[index]:
+                dist[index] = value
+                pq.append((value, index))
+
+        heapq.heapify(pq)
+
+        while pq:
+            curr_dist, curr = heapq.heappop(pq)
+
+            if curr_dist > dist[curr]:
+                continue
+
+            y, x = divmod(curr, width)
+
+            # walking from a neighbour into curr costs the entry cost of curr
+            for dy, dx, offset, delta_cost in graph._neighbours:
+                ny, nx = y - dy, x - dx
+
+                if not (0 <= ny < height and 0 <= nx < width):
+                    continue
+
+                child = curr - offset
+
+                if cost[child] == inf:
+                    continue
+
+                alt = curr_dist + cost[curr] * delta_cost
+
+                if alt < dist[child] and alt <= max_distance:
+                    dist[child] = alt
+                    heapq.heappush(pq, (alt, child))
+
+        return dist
+
+    def get(self, pos: Tuple[int, int]) -> float:
+        return self.distances[self.graph.index(pos)]
+
+    def next_step(self, pos: Tuple[int, int]) -> Optional[Tuple[int, int]]:
+        '''
+        The neighbour of pos that leads downhill the steepest, i.e. along a cheapest path to the goals.
+
+        Returns: the neighbouring position or None if pos is a goal, a local minimum or can not reach any goal
+        '''
+        graph = self.graph
+        height, width = graph.dims
+        cost = graph._cost
+        dist = self.distances
+        y, x = pos
+        curr = y * width + x
+        best, best_value = None, dist[curr]
+
+        for dy, dx, offset, delta_cost in graph._neighbours:
+            ny, nx = y + dy, x + dx
+
+            if not (0 <= ny < height and 0 <= nx < width):
+                continue
+
+            child = curr + offset
+            value = cost[child] * delta_cost + dist[child]
+
+            if dist[child] < dist[curr] and value < float("inf") and (best is None or value < best_value):
+                best, best_value = (ny, nx), value
+
+        return best
+
+    def get_flee_map(self, coefficient: float = FLEE_COEFFICIENT) -> DijkstraMap:
+        '''
+        Returns the flee map of this map, cached until the goals or the graph change.
+        Following it downhill moves away from the goals, preferring open space over dead ends.
+        '''
+        if self._flee_map is None or self._flee_map._version != self.graph.version:
+            flee_map = DijkstraMap(self.graph)
+            flee_map.distances = flee_map._scan({index: value * coefficient for index, value in enumerate(self.distances) if value < float("inf")})
+            flee_map._version = self.graph.version
+            self._flee_map = flee_map
+
+        return self._flee_map
+
+class RegionGraph:
+    '''
+    Abstract graph for hierarchical pathfinding (HPA*). Every walkable cell belongs to a region: one per room,
+    plus one per connected stretch of corridor outside the rooms. Regions are linked through portals,
+    i.e. neighbouring cells that lie in different regions.
+    A search first plans across regions and then refines the path on the grid, but only inside the regions it crosses.
+    '''
+    def __init__(self, walkable: np.ndarray, rooms: Iterable[Tuple[Tuple[int, int], Tuple[int, int]]], deltas: Iterable[Tuple[int, int]]):
+        self.dims: Tuple[int, int] = walkable.shape
+        self.deltas = list(deltas)
+        self.labels: np.ndarray = np.full(self.dims, -1, dtype=np.int32)
+        self.rooms = list(rooms)
+
+        for i, ((y_a, x_a), (y_b, x_b)) in enumerate(self.rooms):
+            room = self.labels[y_a:y_b + 1, x_a:x_b + 1]
+            room[walkable[y_a:y_b + 1, x_a:x_b + 1]] = i
+
+        self.region_count = len(self.rooms)
+        self._label_corridors(walkable)
+
+        # portals[a][b] is a cell of region a next to a cell of region b
+        self.portals: Dict[int, Dict[int, Tuple[int, int]]] = {region: {} for region in range(self.region_count)}
+        self._find_portals()
+
+        ys, xs = np.nonzero(self.labels >= 0)
+        regions = self.labels[ys, xs]
+        counts = np.maximum(np.bincount(regions, minlength=self.region_count), 1)
+        self.centers: List[Tuple[float, float]] = list(zip((np.bincount(regions, ys, self.region_count) / counts).tolist(),
+                                                           (np.bincount(regions, xs, self.region_count) / counts).tolist()))
+        # bounding rectangle of every region as ((y_a, x_a), (y_b, x_b)), inclusive like the rooms
+        low = np.full((self.region_count, 2), max(self.dims), dtype=np.int64)
+        high = np.full((self.region_count, 2), -1, dtype=np.int64)
+        np.minimum.at(low, regions, np.stack((ys, xs), axis=1))
+        np.maximum.at(high, regions, np.stack((ys, xs), axis=1))
+        self.bounds: List[Tuple[Tuple[int, int], Tuple[int, int]]] = [(tuple(a), tuple(b)) for a, b in zip(low.tolist(), high.tolist())]
+        # cost of moving from a region's center through a portal to the neighbouring region's center
+        self._edges: List[List[Tuple[int, float]]] = [
+            [(child, util.distance(self.centers[region], portal) + util.distance(portal, self.centers[child])) for child, portal in self.portals[region].items()]
+            for region in range(self.region_count)]
+
+    def _label_corridors(self, walkable: np.ndarray):
+        height, width = self.dims
+        labels = self.labels
+
+        for start in map(tuple, np.argwhere(walkable & (labels == -1)).tolist()):
+            if labels[start] != -1:
+                continue
+
+            region = self.region_count
+            self.region_count += 1
+            labels[start] = region
+            to_visit = [start]
+
+            while to_visit:
+                y, x = to_visit.pop()
+
+                for dy, dx in self.deltas:
+                    ny, nx = y + dy, x + dx
+
+                    if 0 <= ny < height and 0 <= nx < width and walkable[ny, nx] and labels[ny, nx] == -1:
+                        labels[ny, nx] = region
+                        to_visit.append((ny, nx))
+
+    def _find_portals(self):
+        height, width = self.dims
+        labels = self.labels
+
+        for dy, dx in self.deltas:
+            # compare every cell with its neighbour in direction (dy, dx) using shifted views
+            a = labels[max(0, -dy):height - max(0, dy), max(0, -dx):width - max(0, dx)]
+            b = labels[max(0, dy):height - max(0, -dy), max(0, dx):width - max(0, -dx)]
+            ys, xs = np.nonzero((a >= 0) & (b >= 0) & (a != b))
+
+            for y, x, region_a, region_b in zip((ys + max(0, -dy)).tolist(), (xs + max(0, -dx)).tolist(), a[ys, xs].tolist(), b[ys, xs].tolist()):
+                self.portals[region_a].setdefault(region_b, (y, x))
+
+    def get_region(self, pos: Tuple[int, int]) -> int:
+        return int(self.labels[pos])
+
+    def get_region_mask(self, regions: Iterable[int], passable: np.ndarray = None) -> np.ndarray:
+        '''
+        Boolean grid of the cells in the given regions, and in passable if it is given. Only the bounding rectangles
+        of the regions are looked at.
+        '''
+        mask = np.zeros(self.dims, dtype=bool)
+
+        for region in regions:
+            (y_a, x_a), (y_b, x_b) = self.bounds[region]
+
+            if y_b < y_a:
+                continue
+
+            window = slice(y_a, y_b + 1), slice(x_a, x_b + 1)
+            inside = self.labels[window] == region
+
+            if passable is not None:
+                inside &= passable[window]
+
+            mask[window] |= inside
+
+        return mask
+
+    def plan_regions(self, origin_region: int, dest_region: int) -> Optional[List[int]]:
+        '''
+        A* over the regions, moving between region centers through the portals.
+
+        Returns: the regions crossed in order, or None if dest_region can not be reached
+        '''
+        def heuristic(region: int) -> float:
+            return util.distance(self.centers[region], self.centers[dest_region])
+
+        dist = {origin_region: 0}
+        prev = {}
+        pq = [(heuristic(origin_region), origin_region)]
+        closed = set()
+
+        while pq:
+            _, curr = heapq.heappop(pq)
+
+            if curr in closed:
+                continue
+
+            closed.add(curr)
+
+            if curr == dest_region:
+                path = [curr]
+
+                while path[-1] in prev:
+                    path.append(prev[path[-1]])
+
+                path.reverse()
+                return path
+
+            for child, edge_cost in self._edges[curr]:
+                alt = dist[curr] + edge_cost
+
+                if alt < dist.get(child, float("inf")):
+                    dist[child] = alt
+                    prev[child] = curr
+                    heapq.heappush(pq, (alt + heuristic(child), child))
+
+        return None
+
+    def pathfind(self, graph: GridGraph, origin: Tuple[int, int], dest: Tuple[int, int], heuristic: Callable = _no_heuristic, passable: np.ndarray = None) -> Tuple[List[float], List[int]]:
+        '''
+        Hierarchical search on graph with the same contract as GridGraph.pathfind. The grid search is restricted to the
+        regions of the abstract path. If that fails, e.g. because passable rules out part of it, this falls back
+        to a search over the whole grid.
+        '''
+        origin_region, dest_region = self.get_region(origin), self.get_region(dest)
+        search = graph.pathfind_jps if graph.supports_jump_point_search() else graph.pathfind
+
+        if origin_region == -1 or dest_region == -1:
+            return search(origin, dest, heuristic=heuristic, passable=passable)
+
+        regions = self.plan_regions(origin_region, dest_region)
+
+        if regions is not None:
+            corridor = self.get_region_mask(regions, passable)
+            dist, prev = search(origin, dest, heuristic=heuristic, passable=corridor)
+
+            if graph.get_distance(dist, dest) < float("inf"):
+                return dist, prev
+
+        return search(origin, dest, heuristic=heuristic, passable=passable)
+
+class _PrevBuffer(dict):
+    '''
+    Sparse stand in for a flat previous index buffer, cells without an entry have no previous cell.
+    '''
+    def __missing__(self, index: int) -> int:
+        return -1
+
+class PathTree:
+    '''
+    Dijkstra search tree rooted at one cell that is only grown as far as the queries need. A target inside the
+    already settled part is answered by walking the tree, any other target resumes the search where it stopped.
+    When cells become passable the tree is repaired in place instead of being searched again from scratch.
+    The tree is tied to one graph version and root, see is_current. Its buffers are sparse, so building a tree
+    costs nothing however large the map is.
+    passable is read live, it may change between queries as long as add_passable is told about new cells.
+    '''
+    def __init__(self, graph: GridGraph, root: Tuple[int, int], passable: np.ndarray = None):
+        self.graph = graph
+        self.root = root
+        self.version = graph.version
+        self._passable = _flat_view(passable)
+        start = graph.index(root)
+        self._dist: Dict[int, float] = {start: 0}
+        self._prev: Dict[int, int] = _PrevBuffer()
+        self._pq = [(0, start)]
+
+    def is_current(self, graph: GridGraph, root: Tuple[int, int]) -> bool:
+        return graph is self.graph and graph.version == self.version and root == self.root
+
+    def _relax(self, curr: int, curr_dist: float):
+        graph = self.graph
+        height, width = graph.dims
+        cost = graph._cost
+        dist, prev, passable = self._dist, self._prev, self._passable
+        inf = float("inf")
+        y, x = divmod(curr, width)
+
+        for dy, dx, offset, delta_cost in graph._neighbours:
+            ny, nx = y + dy, x + dx
+
+            if not (0 <= ny < height and 0 <= nx < width):
+                continue
+
+            child = curr + offset
+
+            if passable is not None and not passable[child]:
+                continue
+
+            alt = curr_dist + cost[child] * delta_cost
+
+            if alt < dist.get(child, inf):
+                dist[child] = alt
+                prev[child] = curr
+                heapq.heappush(self._pq, (alt, child))
+
+    def _settle(self, target: int):
+        # target is final once nothing left in the queue could still improve it
+        pq, dist = self._pq, self._dist
+        inf = float("inf")
+
+        while pq and pq[0][0] < dist.get(target, inf):
+            curr_dist, curr = heapq.heappop(pq)
+
+            if curr_dist > dist[curr]:
+                continue
+
+            self._relax(curr, curr_dist)
+
+    def distance_to(self, dest: Tuple[int, int]) -> float:
+        target = self.graph.index(dest)
+        self._settle(target)
+        return self._dist.get(target, float("inf"))
+
+    def path_to(self, dest: Tuple[int, int]) -> List[Tuple[int, int]]:
+        '''
+        Cheapest path from the root to dest. Like GridGraph.trace_path, an unreachable destination results in [dest].
+        '''
+        self._settle(self.graph.index(dest))
+        return self.graph.trace_path(self._prev, dest)
+
+    def add_passable(self, positions: Iterable[Tuple[int, int]]):
+        '''
+        Repair the tree after the given cells became passable, call it right after changing the passable grid.
+        Each new cell takes its best distance from its neighbours and is queued, the next query then propagates
+        any improvement through the rest of the tree.
+        '''
+        if self._passable is None:
+            return
+
+        graph = self.graph
+        height, width = graph.dims
+        cost = graph._cost
+        dist, prev = self._dist, self._prev
+        inf = float("inf")
+
+        for cell in map(graph.index, positions):
+            y, x = divmod(cell, width)
+
+            for dy, dx, offset, delta_cost in graph._neighbours:
+                ny, nx = y - dy, x - dx
+
+                if not (0 <= ny < height and 0 <= nx < width):
+                    continue
+
+                parent = cell - offset
+                alt = dist.get(parent, inf) + cost[cell] * delta_cost
+
+                if alt < dist.get(cell, inf):
+                    dist[cell] = alt
+                    prev[cell] = parent
+
+            if cell in dist:
+                heapq.heappush(self._pq, (dist[cell], cell))
@@ -12,16 +12,16 @@ class PhysicsSystem(ecs.System):
         pass
         
     def pos_is_free(self, em: ecs.TilemapEcs, pos: Tuple[int, int]):
-        return em.tilemap.pos_is_in_bounds((pos)) and not em.tilemap[pos].is_collider() and not any(e.has_component(em, components.CollisionComponent) for e in em.get_entities_at(pos))
+        return em.tilemap.pos_is_in_bounds((pos)) and not em.tilemap.is_collider(pos) and not any(e.has_component(em, components.CollisionComponent) for e in em.get_entities_at(pos))
 
     def get_attackable_at(self, em: ecs.TilemapEcs, pos: Tuple[int, int]):
-        flee_vulnerable = em.query_all_with_components(components.FleeVulnerabilityComponent)
+        flee_vulnerable = em.view(components.FleeVulnerabilityComponent)
         attackable_flee_vulnerable = set(list(e for e in flee_vulnerable if e.get_component(em, components.FleeVulnerabilityComponent).vulnerable_square == pos))
         attackable_default = (e for e in em.get_entities_at(pos) if e.has_component(em, components.HealthComponent))
         return attackable_flee_vulnerable.union(attackable_default)
 
     def process(self, em: ecs.TilemapEcs, event: events.PhysicsTickEvent):
-        moving = list(em.query_all_with_components(components.MovementActionComponent))
+        moving = em.view(components.MovementActionComponent)
         
         for entity in moving:
             dy, dx = em.get_components(entity)[components.MovementActionComponent]
@@ -37,7 +37,7 @@ class PhysicsSystem(ecs.System):
                     target.get_component(em, components.HealthComponent).health -= damage
                     
                     hitmarker_pos = em.get_pos(target)
-                    em.create_entity(hitmarker_pos, *entity_definitions.hitmarker(damage))
+                    em.create_entity(hitmarker_pos, *entity_definitions.hitmarker(damage, em.get_ticks()))
 
             if self.pos_is_free(em, new_pos):
                 if entity.has_component(em, components.FleeVulnerabilityComponent):
@@ -61,7 +61,7 @@ class PhysicsSystem(ecs.System):
                         hc = entity.get_component(em, components.HealthComponent)
                         hc.health = min(hc.max_health, hc.health + comp.heal_amount)
                         
-                        to_add_markers.append((new_pos, *entity_definitions.healmarker(comp.heal_amount)))
+                        to_add_markers.append((new_pos, *entity_definitions.healmarker(comp.heal_amount, em.get_ticks())))
 
                         if comp.nextlevel_switch:
                             em.emit_event(events.LoadNextDungeonEvent())
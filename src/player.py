@@ -1,28 +1,53 @@
 from typing import *
 import operator
 
+import numpy as np
+
 from . import ecs
 from . import components
 from . import tiles
 from . import events
 from . import util
+from . import pathfinding
+from . import fov
 
 class PlayerSystem(ecs.System):
     IDLE_ACTION = components.MovementActionComponent(0, 0)
     PLAYER_DELTAS_COST = util.DIAGONAL_DELTAS_COST | util.CARDINAL_DELTAS_COST
     AUTOWALK_FREQUENCY = 100# in milliseconds
     SIGHT_RADIUS = 12
+    FOV_ALGORITHM = fov.SHADOWCAST # fov.BRESENHAM for the old per tile line of sight checks
+    HIERARCHICAL_PATHFIND_DISTANCE = 16 # plan across rooms first for targets at least this far away
+
+    def __init__(self):
+        # search tree rooted at the player that answers the mouse hover previews
+        self._path_tree: pathfinding.PathTree = None
+
+    def get_path_tree(self, em: ecs.TilemapEcs, pos, pc: components.PlayerControlComponent) -> pathfinding.PathTree:
+        '''
+        Returns the hover preview search tree, which is only rebuilt when the player moved or the map changed.
+        '''
+        graph = em.tilemap.get_grid_graph(tiles.DEFAULT_TILE_WEIGHTS, deltas_cost=PlayerSystem.PLAYER_DELTAS_COST)
+
+        if self._path_tree is None or not self._path_tree.is_current(graph, pos):
+            self._path_tree = pathfinding.PathTree(graph, pos, passable=pc.discovered)
+
+        return self._path_tree
 
     def recompute_path(self, em: ecs.TilemapEcs, pos, dest, pc: components.PlayerControlComponent):
-        graph = em.tilemap.get_graph(tiles.DEFAULT_TILE_WEIGHTS, deltas_cost=PlayerSystem.PLAYER_DELTAS_COST)
+        graph = em.tilemap.get_grid_graph(tiles.DEFAULT_TILE_WEIGHTS, deltas_cost=PlayerSystem.PLAYER_DELTAS_COST)
+        # the player only plans through tiles they have already discovered
+        passable = pc.discovered
 
-        for node in graph.nodes:
-            if node not in pc.discovered:
-                for edge in graph.edges[node]:
-                    edge.weight = float("inf")
+        if util.chebyshev_distance(pos, dest) >= PlayerSystem.HIERARCHICAL_PATHFIND_DISTANCE:
+            regions = em.tilemap.get_region_graph(PlayerSystem.PLAYER_DELTAS_COST)
+            dist, prev = regions.pathfind(graph, pos, dest, heuristic=util.chebyshev_distance, passable=passable)
+        elif graph.supports_jump_point_search():
+            dist, prev = graph.pathfind_jps(pos, dest, heuristic=util.chebyshev_distance, passable=passable)
+        else:
+            dist, prev = graph.pathfind(pos, dest, heuristic=util.chebyshev_distance, passable=passable)
 
-        dist, prev = graph.pathfind(pos, dest, heuristic=util.chebyshev_distance)
-        return list(graph.trace_path(prev, dest))
+        return graph.trace_path(prev, dest)
 
     def autowalk_step(self, em: ecs.TilemapEcs, player: ecs.Entity, pc: components.PlayerControlComponent) -> bool:
         '''
@@ -49,22 +74,26 @@ class PlayerSystem(ecs.System):
     def update_visibility(self, em: ecs.TilemapEcs, player: ecs.Entity):
         player_pos = em.get_pos(player)
         pc: components.PlayerControlComponent = player.get_component(em, components.PlayerControlComponent)
-        pc.visible = set()
-        
-        for pos in em.tilemap.iterate_radius(player_pos, PlayerSystem.SIGHT_RADIUS):
-            if em.tilemap.in_los(player_pos, pos):
-                pc.visible.add(pos)
 
-        pc.discovered = pc.discovered.union(pc.visible)
+        if pc.discovered is None or pc.discovered.shape != em.tilemap.dims:
+            pc.resize(em.tilemap.dims)
+
+        fov.compute_fov_mask(em.tilemap, player_pos, PlayerSystem.SIGHT_RADIUS, PlayerSystem.FOV_ALGORITHM, out=pc.visible)
+        np.greater(pc.visible, pc.discovered, out=pc.newly_discovered)
+        pc.discovered |= pc.visible
+        pc.visibility_version += 1
+
+        if self._path_tree is not None and pc.newly_discovered.any():
+            self._path_tree.add_passable(map(tuple, np.argwhere(pc.newly_discovered).tolist()))
             
         
 
     def process(self, em: ecs.TilemapEcs, event):
         try:
-            player = em.query_single_with_component(components.PlayerControlComponent)
+            player = em.view(components.PlayerControlComponent).single()
         except KeyError:
             try:
-                bartext = em.query_single_with_component(components.BarTextComponent).get_component(em, components.BarTextComponent)
+                bartext = em.view(components.BarTextComponent).single().get_component(em, components.BarTextComponent)
                 bartext.text = "Game over. Press Space to restart."
             except KeyError:
                 pass
@@ -77,14 +106,14 @@ class PlayerSystem(ecs.System):
         match type(event):
             case events.UserHoversTileWithMouseEvent:
                 if not pc.do_autowalk:
-                    if event.pos not in pc.discovered:
+                    if not pc.is_discovered(event.pos):
                         pc.autowalk_plan = None
                     else:
-                        pc.autowalk_plan = self.recompute_path(em, pos, event.pos, pc)
+                        pc.autowalk_plan = self.get_path_tree(em, pos, pc).path_to(event.pos)
 
             case events.UserClicksTileWithMouseEvent:
                 if event.pos != pos:
-                    if event.pos in pc.discovered:
+                    if pc.is_discovered(event.pos):
                         pc.autowalk_plan = self.recompute_path(em, pos, event.pos, pc)
                         pc.autowalk_timer = PlayerSystem.AUTOWALK_FREQUENCY
                         pc.do_autowalk = True
@@ -0,0 +1,97 @@
+'''
+Per system profiling of Ecs.emit_event. Turn it on with Ecs.set_profiling(True), after that every call of a system
+is timed and recorded under (event type, system type). Events emitted from inside a system are nested, so a system's
+total time includes the systems it triggered, and its self time does not.
+'''
+from __future__ import annotations
+
+from dataclasses import dataclass, asdict
+from typing import *
+import csv
+import json
+import time
+
+@dataclass
+class SystemStats:
+    event: str
+    system: str
+    calls: int = 0
+    # wall time in seconds, total includes everything the system emitted while it ran
+    total: float = 0.0
+    self_time: float = 0.0
+    max: float = 0.0
+    # deepest nesting level the system was called at, 1 for events emitted from outside of any system
+    max_depth: int = 0
+
+class Profiler:
+    FIELDS = ("event", "system", "calls", "total", "self_time", "max", "max_depth")
+
+    def __init__(self):
+        self.stats: Dict[Tuple[Type, Type], SystemStats] = {}
+        # time spent in nested calls, one entry per system call currently running
+        self._child_time: List[float] = []
+
+    @property
+    def depth(self) -> int:
+        return len(self._child_time)
+
+    def call(self, em, system, event):
+        '''
+        Run system.process(em, event) and record it.
+        '''
+        self._record(type(event), system, system.process, em, event)
+
+    def call_batch(self, em, system, event_type: Type, events: List):
+        '''
+        Run system.process_batch(em, events) and record it as one call.
+        '''
+        self._record(event_type, system, system.process_batch, em, events)
+
+    def _record(self, event_type: Type, system, function: Callable, *args):
+        key = event_type, type(system)
+        stats = self.stats.get(key)
+
+        if stats is None:
+            stats = self.stats[key] = SystemStats(key[0].__name__, key[1].__name__)
+
+        self._child_time.append(0.0)
+        start = time.perf_counter()
+
+        try:
+            function(*args)
+        finally:
+            elapsed = time.perf_counter() - start
+            child_time = self._child_time.pop()
+            stats.calls += 1
+            stats.total += elapsed
+            stats.self_time += elapsed - child_time
+            stats.max = max(stats.max, elapsed)
+            stats.max_depth = max(stats.max_depth, len(self._child_time) + 1)
+
+            if self._child_time:
+                self._child_time[-1] += elapsed
+
+    def reset(self):
+        self.stats.clear()
+
+    def rows(self, sort_by: str = "total") -> List[Dict[str, Any]]:
+        return sorted((asdict(stats) for stats in self.stats.values()), key=lambda row: row[sort_by], reverse=True)
+
+    def export_json(self, path: str):
+        with open(path, "w") as file:
+            json.dump(self.rows(), file, indent=2)
+
+    def export_csv(self, path: str):
+        with open(path, "w", newline="") as file:
+            writer = csv.DictWriter(file, Profiler.FIELDS)
+            writer.writeheader()
+            writer.writerows(self.rows())
+
+    def export(self, path: str):
+        '''
+        Export as CSV if path ends with .csv, as JSON otherwise.
+        '''
+        if path.endswith(".csv"):
+            self.export_csv(path)
+        else:
+            self.export_json(path)
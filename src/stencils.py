@@ -0,0 +1,61 @@
+'''
+Precomputed radius stencils for area queries. A stencil is a boolean square of side 2 * floor(radius) + 1 that marks
+the offsets within radius of its center, cached per (radius, metric) and clipped to the map with array slicing.
+'''
+import functools
+from typing import *
+
+import numpy as np
+
+EUCLIDEAN = "euclidean"
+CHEBYSHEV = "chebyshev"
+MANHATTAN = "manhattan"
+
+_METRICS: Dict[str, Callable[[np.ndarray, np.ndarray, float], np.ndarray]] = {
+    EUCLIDEAN: lambda dy, dx, radius: dy * dy + dx * dx <= radius * radius,
+    CHEBYSHEV: lambda dy, dx, radius: np.maximum(np.abs(dy), np.abs(dx)) <= radius,
+    MANHATTAN: lambda dy, dx, radius: np.abs(dy) + np.abs(dx) <= radius,
+}
+
+@functools.lru_cache(maxsize=None)
+def get_stencil(radius: float, metric: str = EUCLIDEAN) -> np.ndarray:
+    '''
+    Returns the cached stencil. Do not modify it.
+    '''
+    if metric not in _METRICS:
+        raise ValueError(f"Unknown metric {metric}, expected one of {list(_METRICS)}.")
+
+    reach = int(radius)
+    dy, dx = np.mgrid[-reach:reach + 1, -reach:reach + 1]
+    stencil = _METRICS[metric](dy, dx, radius)
+    stencil.setflags(write=False)
+    return stencil
+
+def clip(origin: Tuple[int, int], radius: float, dims: Tuple[int, int]) -> Tuple[Tuple[slice, slice], Tuple[slice, slice]]:
+    '''
+    Returns (map slices, stencil slices) that line up the stencil centered on origin with the part of the map it covers.
+    '''
+    reach = int(radius)
+    map_slices = []
+    stencil_slices = []
+
+    for center, size in zip(origin, dims):
+        start, end = max(0, center - reach), min(size, center + reach + 1)
+        map_slices.append(slice(start, end))
+        stencil_slices.append(slice(start - (center - reach), end - (center - reach)))
+
+    return tuple(map_slices), tuple(stencil_slices)
+
+def positions_in_radius(origin: Tuple[int, int], radius: float, dims: Tuple[int, int], metric: str = EUCLIDEAN) -> np.ndarray:
+    '''
+    All in bounds positions within radius of origin as an (n, 2) array of (y, x) rows.
+    '''
+    if radius < 0:
+        return np.empty((0, 2), dtype=np.intp)
+
+    (map_y, map_x), stencil_slices = clip(origin, radius, dims)
+    return np.argwhere(get_stencil(radius, metric)[stencil_slices]) + (map_y.start, map_x.start)
+
+def is_within(a: Tuple[int, int], b: Tuple[int, int], radius: float, metric: str = EUCLIDEAN) -> bool:
+    dy, dx = a[0] - b[0], a[1] - b[1]
+    return bool(_METRICS[metric](dy, dx, radius))
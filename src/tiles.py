@@ -9,8 +9,13 @@ import os
 import time
 import itertools
 
+import numpy as np
+
 from . import util
 from . import ecs
+from . import pathfinding
+from . import los
+from . import stencils
 
 class Tile(Enum):
     EMPTY = auto()
@@ -35,20 +40,109 @@ LOS_BLOCKERS = {Tile.WALL}
 
 DEFAULT_TILE_WEIGHTS = {tile: float("inf") if tile.is_collider() else 1 for tile in Tile}
 
+# How generate_random_connected_rooms connects its rooms: each room to the next one in placement order,
+# or a minimum spanning tree over the rooms (plus a few extra loops) found with a single search
+CORRIDORS_SEQUENTIAL = "sequential"
+CORRIDORS_SPANNING_TREE = "spanning_tree"
+
+# The tilemap stores tiles as their uint8 enum values. These map the values back to tiles and tile properties.
+# auto() numbers the tiles starting at 1, so index 0 is unused.
+TILES_BY_VALUE: Tuple[Tile, ...] = (None, *Tile)
+
+def tile_lookup_table(values: Dict[Tile, Any], default: Any = 0, dtype: Any = np.float64) -> np.ndarray:
+    '''
+    Build an array indexed by tile value, e.g. to turn the tilemap into a weight grid with table[tilemap.cells].
+    '''
+    table = np.full(len(TILES_BY_VALUE), default, dtype=dtype)
+
+    for tile, value in values.items():
+        table[tile.value] = value
+
+    return table
+
+COLLIDER_TABLE = tile_lookup_table({tile: True for tile in TILE_COLLDIERS}, False, bool)
+LOS_BLOCKER_TABLE = tile_lookup_table({tile: True for tile in LOS_BLOCKERS}, False, bool)
+
 class Tilemap:
     def __init__(self, dims: Tuple[int, int]=(16, 16), init_tile=Tile.EMPTY):
         self.dims = dims
-        height, width = dims
-        self._data: List[List[Tile]] = [[init_tile] * width for _ in range(height)]
+        self._data: np.ndarray = np.full(dims, init_tile.value, dtype=np.uint8)
+        # boolean masks derived from the tiles, kept in sync on every write once they were requested
+        self._masks: Dict[int, Tuple[np.ndarray, np.ndarray]] = {}
+        # shared navigation graphs, one per (weights, deltas) configuration, also kept in sync on every write
+        self._grid_graphs: Dict[Tuple, Tuple[np.ndarray, pathfinding.GridGraph]] = {}
+        self._flat_indices: np.ndarray = np.arange(dims[0] * dims[1]).reshape(dims)
+        # incremented on every change to the tiles
+        self.version = 0
+        # room rectangles and the pairs of rooms connected by corridors, filled in by the generator
+        self.rooms: List[Tuple[Tuple[int, int], Tuple[int, int]]] = []
+        self.room_connections: List[Tuple[int, int]] = []
+        self._region_graphs: Dict[FrozenSet, Tuple[int, pathfinding.RegionGraph]] = {}
+        self._los: los.LineOfSight = None
 
     def __getitem__(self, pos: Tuple[int, int]) -> Tile:
-        y, x = pos
-        return self._data[y][x]
+        return TILES_BY_VALUE[self._data[pos]]
     
     def __setitem__(self, pos: Tuple[int, int], to: Tile):
-        self._graph = None
-        y, x = pos
-        self._data[y][x] = to
+        self._data[pos] = to.value
+        self._tiles_changed(pos)
+
+    @property
+    def cells(self) -> np.ndarray:
+        '''
+        The raw uint8 tile values. Treat this as read only and write through the Tilemap methods,
+        otherwise the cached masks go stale.
+        '''
+        return self._data
+
+    def set_cells(self, cells: np.ndarray, rooms: Iterable[Tuple[Tuple[int, int], Tuple[int, int]]] = (), room_connections: Iterable[Tuple[int, int]] = ()):
+        '''
+        Replace all tiles at once with raw tile values of the same shape, e.g. a level generated somewhere else.
+        '''
+        if cells.shape != tuple(self.dims):
+            raise ValueError(f"Cells of shape {cells.shape} do not fit a tilemap of shape {self.dims}.")
+
+        self._data = cells.astype(np.uint8)
+        self.rooms = [tuple(map(tuple, room)) for room in rooms]
+        self.room_connections = [tuple(connection) for connection in room_connections]
+        self._tiles_changed()
+
+    def _get_mask(self, table: np.ndarray) -> np.ndarray:
+        key = id(table)
+
+        if key not in self._masks:
+            self._masks[key] = table, table[self._data]
+
+        return self._masks[key][1]
+
+    def _tiles_changed(self, index: Any = ...):
+        '''
+        Call after writing to self._data[index] so the cached masks and graphs are updated for exactly those cells.
+        '''
+        self.version += 1
+
+        for table, mask in self._masks.values():
+            mask[index] = table[self._data[index]]
+
+        for table, graph in self._grid_graphs.values():
+            if index is ...:
+                graph.set_cost_grid(table[self._data])
+            else:
+                graph.update_costs(np.ravel(self._flat_indices[index]).tolist(), np.ravel(table[self._data[index]]).tolist())
+
+    @property
+    def collider_mask(self) -> np.ndarray:
+        return self._get_mask(COLLIDER_TABLE)
+    
+    @property
+    def los_blocker_mask(self) -> np.ndarray:
+        return self._get_mask(LOS_BLOCKER_TABLE)
+
+    def is_collider(self, pos: Tuple[int, int]) -> bool:
+        return bool(self.collider_mask[pos])
+
+    def blocks_los(self, pos: Tuple[int, int]) -> bool:
+        return bool(self.los_blocker_mask[pos])
 
 
     def pos_is_in_bounds(self, pos: Tuple[int, int]) -> bool:
@@ -57,112 +151,224 @@ class Tilemap:
         return 0 <= y < height and 0 <= x < width
 
     def fill_rect(self, a: Tuple[int, int], b: Tuple[int, int], tile: Tile):
-        y_start, y_end = a[0], b[0]
-        x_start, x_end = a[1], b[1]
-
-        for y, x in itertools.product(range(y_start, y_end + 1), 
-                                      range(x_start, x_end + 1)):
-            self._data[y][x] = tile
+        index = slice(a[0], b[0] + 1), slice(a[1], b[1] + 1)
+        self._data[index] = tile.value
+        self._tiles_changed(index)
 
     def trace_path(self, path: List[Tuple[int, int]], tile: Tile):
-        for y, x in path:
-            self._data[y][x] = tile
+        if not path:
+            return
+
+        index = tuple(np.array(path).T)
+        self._data[index] = tile.value
+        self._tiles_changed(index)
     
     def iterate_with_tile(self, tile: Tile) -> Generator[Tuple[int, int], None, None]:
-        height, width = self.dims
+        for y, x in np.argwhere(self._data == tile.value).tolist():
+            yield y, x
 
-        for y, x in itertools.product(range(height), 
-                                      range(width)):
-            if self._data[y][x] == tile: 
-                yield y, x
+    def to_tile_grid(self) -> List[List[Tile]]:
+        return [[TILES_BY_VALUE[value] for value in row] for row in self._data.tolist()]
 
     def get_graph(self, weights: Dict[Tile, float] = None, deltas_cost: Dict[Tuple[int, int] : float] = ((1,0), (0,1), (-1,0), (0,-1))):
         '''
         Get a graph view for pathfinding. Will recompute the graph. deltas_cost is a doct mapping deltas to their weight multiplier.
         '''
-        return util.Graph.from_2dgrid(self._data, weights, deltas_cost)
+        return util.Graph.from_2dgrid(self.to_tile_grid(), weights, deltas_cost)
+
+    def get_grid_graph(self, weights: Dict[Tile, float] = None, deltas_cost: Dict[Tuple[int, int] : float] = ((1,0), (0,1), (-1,0), (0,-1))) -> pathfinding.GridGraph:
+        '''
+        Get a grid graph for pathfinding directly on the tile array. Same arguments as get_graph.
+        The graph is cached and shared by everyone asking for the same configuration. Tile changes only update
+        the costs of the changed cells.
+        '''
+        deltas_key = frozenset(deltas_cost.items()) if isinstance(deltas_cost, dict) else frozenset((delta, 1) for delta in deltas_cost)
+        key = frozenset((weights or {}).items()), deltas_key
+
+        if key not in self._grid_graphs:
+            table = tile_lookup_table(weights or {}, default=1)
+            self._grid_graphs[key] = table, pathfinding.GridGraph(table[self._data], deltas_cost)
+
+        return self._grid_graphs[key][1]
     
-    def generate_random_connected_rooms(self, iters=1000, min_room_size=1, max_room_size=5, wall_weight=10000, verbose=True):
-        print("Generating rooms...")
+    def get_region_graph(self, deltas: Iterable[Tuple[int, int]] = ((1,0), (0,1), (-1,0), (0,-1))) -> pathfinding.RegionGraph:
+        '''
+        Abstract graph of the rooms and corridors for hierarchical pathfinding. Rebuilt lazily when the tiles changed.
+        '''
+        key = frozenset(deltas)
+
+        if key not in self._region_graphs or self._region_graphs[key][0] != self.version:
+            self._region_graphs[key] = self.version, pathfinding.RegionGraph(~self.collider_mask, self.rooms, key)
+
+        return self._region_graphs[key][1]
+
+    def generate_random_connected_rooms(self, iters=1000, min_room_size=1, max_room_size=5, wall_weight=10000, verbose=True, connection_strategy=CORRIDORS_SEQUENTIAL, extra_loops=0, rng: random.Random = random):
+        '''
+        Pass a seeded random.Random as rng to get the same level every time, the global random module is used otherwise.
+        '''
+        if verbose: print("Generating rooms...")
         map_height, map_width = self.dims
-        r = [[Tile.WALL] * map_width for _ in range(map_height)]
+        r = np.full(self.dims, Tile.WALL.value, dtype=np.uint8)
         rooms = []
-        unoccupied = set(itertools.product(range(1, map_height - 1), range(1, map_width - 1)))
+        # cells that can still hold the corner of a new room, and a grid of all cells covered by grown rooms
+        unoccupied = util.IndexedSet(itertools.product(range(1, map_height - 1), range(1, map_width - 1)))
+        occupied = np.zeros(self.dims, dtype=bool)
 
         for i in range(iters):
+            if not unoccupied:
+                break
 
-            y_pos, x_pos = random.choice(list(unoccupied))
+            y_pos, x_pos = unoccupied.choice(rng)
 
-            height = random.randint(min_room_size, max_room_size)
-            width = random.randint(min_room_size, max_room_size)
+            height = rng.randint(min_room_size, max_room_size)
+            width = rng.randint(min_room_size, max_room_size)
 
             if not self.pos_is_in_bounds((y_pos + height + 1, 0)) or not self.pos_is_in_bounds((0, x_pos + width + 1)):
                 continue
             
             a0, b0 = (y_pos, x_pos), (y_pos + height, x_pos + width)
 
-            if not any((util.rects_intersect(a0, b0, *util.grow_rect(a1, b1, 1)) for a1, b1 in rooms)):
+            # the room may not touch any grown room, which is exactly a lookup of its cells in the occupancy grid
+            if not occupied[y_pos:y_pos + height + 1, x_pos:x_pos + width + 1].any():
                 rooms.append((a0, b0))
+                (y_a, x_a), (y_b, x_b) = util.grow_rect(a0, b0, 1)
+                occupied[y_a:y_b + 1, x_a:x_b + 1] = True
 
-                for y, x in util.iterate_rect(*util.grow_rect(a0, b0, 1)):
-                    if (y, x) in unoccupied:
-                        unoccupied.remove((y, x))
+                for pos in util.iterate_rect((y_a, x_a), (y_b, x_b)):
+                    unoccupied.discard(pos)
 
-        for a, b in rooms:
-            util.grid2d_fill_rect(r, a, b, Tile.EMPTY)
+        for (y_a, x_a), (y_b, x_b) in rooms:
+            r[y_a:y_b + 1, x_a:x_b + 1] = Tile.EMPTY.value
 
         
 
-        print("Generating corridors...")
+        if verbose: print("Generating corridors...")
+        self.rooms = rooms
+        # one cost grid for the whole corridor phase, carved cells become cheap floor for the corridors after them
+        graph = pathfinding.GridGraph(tile_lookup_table({Tile.EMPTY: 1, Tile.WALL: wall_weight})[r], util.CARDINAL_DELTAS_COST)
+
+        if connection_strategy == CORRIDORS_SEQUENTIAL:
+            self.room_connections = self._carve_sequential_corridors(r, graph, rooms, verbose)
+        elif connection_strategy == CORRIDORS_SPANNING_TREE:
+            self.room_connections = self._carve_spanning_tree_corridors(r, graph, rooms, extra_loops, rng)
+        else:
+            raise ValueError(f"Unknown connection strategy {connection_strategy}.")
+
+        self._data = r
+        self._tiles_changed()
+
+    @staticmethod
+    def _carve(r: np.ndarray, graph: pathfinding.GridGraph, indices: List[int]):
+        r.flat[indices] = Tile.EMPTY.value
+        graph.update_costs(indices, itertools.repeat(1))
+
+    @staticmethod
+    def _carve_sequential_corridors(r: np.ndarray, graph: pathfinding.GridGraph, rooms: List[Tuple[Tuple[int, int], Tuple[int, int]]], verbose: bool) -> List[Tuple[int, int]]:
+        connections = []
+
         for i, (room, next_room) in enumerate(zip(rooms, rooms[1:])):
-            if i % 10 == 0: print(f"{i}/{len(rooms)} rooms processed")
+            if verbose and i % 10 == 0: print(f"{i}/{len(rooms)} rooms processed")
             pathfind_origin = util.get_rect_center(*room)
             pathfind_dest = util.get_rect_center(*next_room)
-            graph = util.Graph.from_2dgrid(r, weights={Tile.EMPTY: 1, Tile.WALL: wall_weight}, deltas_cost=util.CARDINAL_DELTAS_COST)
             _, prev = graph.pathfind(pathfind_origin, pathfind_dest, heuristic=util.manhatten_distance)
-            path = graph.trace_path(prev, pathfind_dest)
-            util.grid2d_trace_path(r, path, Tile.EMPTY)
+            Tilemap._carve(r, graph, [graph.index(pos) for pos in graph.trace_path(prev, pathfind_dest)])
+            connections.append((i, i + 1))
 
-        
-        self._data = r
+        return connections
+
+    @staticmethod
+    def _carve_spanning_tree_corridors(r: np.ndarray, graph: pathfinding.GridGraph, rooms: List[Tuple[Tuple[int, int], Tuple[int, int]]], extra_loops: int, rng: random.Random) -> List[Tuple[int, int]]:
+        '''
+        Grows all rooms at once with one multi source search. Wherever two rooms' regions touch, the two prev chains
+        through that border form the cheapest corridor between them. Kruskal picks a spanning tree from these candidates,
+        then extra_loops random leftover candidates are carved as well.
+        '''
+        if len(rooms) < 2:
+            return []
+
+        dist, prev, owner = graph.pathfind_multi_source([util.get_rect_center(*room) for room in rooms])
+        dist_grid = np.array(dist).reshape(graph.dims)
+        owner_grid = np.array(owner).reshape(graph.dims)
+        cost_grid = np.array(graph._cost).reshape(graph.dims)
+        flat_indices = np.arange(owner_grid.size).reshape(graph.dims)
+        keys, totals, borders = [], [], []
+
+        # candidate corridors from every pair of horizontally and vertically adjacent cells owned by different rooms
+        for a, b in (((slice(None), slice(None, -1)), (slice(None), slice(1, None))), ((slice(None, -1), slice(None)), (slice(1, None), slice(None)))):
+            border = owner_grid[a] != owner_grid[b]
+            owner_a, owner_b = owner_grid[a][border], owner_grid[b][border]
+            keys.append(np.minimum(owner_a, owner_b) * len(rooms) + np.maximum(owner_a, owner_b))
+            totals.append(dist_grid[a][border] + dist_grid[b][border] + cost_grid[b][border])
+            borders.append(np.stack((flat_indices[a][border], flat_indices[b][border]), axis=1))
+
+        keys, totals, borders = np.concatenate(keys), np.concatenate(totals), np.concatenate(borders)
+        # cheapest border cell pair for every pair of touching rooms
+        order = np.lexsort((totals, keys))
+        _, first = np.unique(keys[order], return_index=True)
+        candidates = order[first][np.argsort(totals[order[first]], kind="stable")]
+
+        parent = list(range(len(rooms)))
+
+        def find(i: int) -> int:
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        connections = []
+        leftover = []
+
+        for candidate in candidates.tolist():
+            room_a, room_b = divmod(int(keys[candidate]), len(rooms))
+            root_a, root_b = find(room_a), find(room_b)
+
+            if root_a == root_b:
+                leftover.append(candidate)
+                continue
+
+            parent[root_a] = root_b
+            connections.append(candidate)
+
+        connections.extend(rng.sample(leftover, min(extra_loops, len(leftover))))
+        corridors = []
+
+        for candidate in connections:
+            cells = []
+
+            for curr in borders[candidate].tolist():
+                while curr != -1:
+                    cells.append(curr)
+                    curr = prev[curr]
 
-    def get_random_empty_tile(self):
-        return random.choice(list(self.iterate_with_tile(Tile.EMPTY)))
+            Tilemap._carve(r, graph, cells)
+            corridors.append(divmod(int(keys[candidate]), len(rooms)))
+
+        return corridors
+
+    def get_random_empty_tile(self, rng: random.Random = random):
+        empty = np.argwhere(self._data == Tile.EMPTY.value)
+        y, x = empty[rng.randrange(len(empty))].tolist()
+        return y, x
     
     def in_los(self, origin: Tuple[int, int], destination: Tuple[int, int]) -> bool:
         '''
         Returns true if destination can be seen from origin.
         '''
-        for pos in list(util.iterate_line(origin, destination))[:-1]:
-            if self[pos].blocks_los():
-                return False
+        return self.los.in_los(origin, destination)
 
-        return True
-
-    def iterate_radius(self, origin: Tuple[int, int], radius: float, deltas: Tuple[Tuple[int, int]] = ((1,0), (0,1), (-1,0), (0,-1))) -> Generator[Tuple[int, int], None, None]:
+    @property
+    def los(self) -> los.LineOfSight:
         '''
-        Iterate through all tiles whose center lies in the specified radius from the position.
+        The cached line of sight service of this tilemap, created on first use.
         '''
+        if self._los is None:
+            self._los = los.LineOfSight(self)
 
-        visited = set()
-        to_visit = [origin]
+        return self._los
 
-        while to_visit:
-            curr = to_visit.pop()
-            visited.add(curr)
-            dist_to_origin = util.distance(curr, origin)
-
-            if dist_to_origin <= radius:
-                yield curr
-            else:
-                continue
-            
-            for dy, dx in deltas:
-                curr_y, curr_x = curr
-                new = curr_y + dy, curr_x + dx
-                
-                if self.pos_is_in_bounds(new) and new not in visited and new not in to_visit:
-                    to_visit.append(new)
-        
-
-    
\ No newline at end of file
+    def iterate_radius(self, origin: Tuple[int, int], radius: float, metric: str = stencils.EUCLIDEAN) -> Generator[Tuple[int, int], None, None]:
+        '''
+        Iterate through all tiles whose center lies in the specified radius from the position.
+        '''
+        for y, x in stencils.positions_in_radius(origin, radius, self.dims, metric).tolist():
+            yield y, x
@@ -4,6 +4,7 @@ import operator
 from dataclasses import dataclass, field, asdict
 from typing import *
 import itertools
+import random
 
 CARDINAL_DELTAS = [(1,0), (0,1), (0,-1), (-1,0)]
 DIAGONAL_DELTAS = [(1,1), (-1,-1), (1,-1), (-1, 1)]
@@ -76,6 +77,53 @@ def grid2d_iterate_with_tile(grid: List[List], tile):
     for i, j in itertools.product(range(height), range(width)):
         if grid[i][j] == tile: yield i, j
 
+class IndexedSet:
+    '''
+    Set with O(1) add, remove and uniform random choice. Items live in a list and a dict maps them to their index,
+    removal swaps the last item into the hole.
+    '''
+    def __init__(self, items: Iterable[Hashable] = ()):
+        self._items: List[Hashable] = []
+        self._index: Dict[Hashable, int] = {}
+
+        for item in items:
+            self.add(item)
+
+    def add(self, item: Hashable):
+        if item not in self._index:
+            self._index[item] = len(self._items)
+            self._items.append(item)
+
+    def discard(self, item: Hashable):
+        index = self._index.pop(item, None)
+
+        if index is None:
+            return
+
+        last = self._items.pop()
+
+        if index < len(self._items):
+            self._items[index] = last
+            self._index[last] = index
+
+    def remove(self, item: Hashable):
+        if item not in self._index:
+            raise KeyError(item)
+
+        self.discard(item)
+
+    def choice(self, rng: random.Random = random) -> Hashable:
+        return self._items[rng.randrange(len(self._items))]
+
+    def __contains__(self, item: Hashable) -> bool:
+        return item in self._index
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __iter__(self) -> Iterator[Hashable]:
+        return iter(self._items)
+
 @dataclass(order=True)
 class _Edge:
     weight: float